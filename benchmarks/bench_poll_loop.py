@@ -0,0 +1,94 @@
+"""Drives E3DC2MQTT against a simulated device and an in-process MQTT client.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_poll_loop --cycles 500 --latency 0.002 --jitter 0.001 -- --publish-mode changes
+
+Everything after -- is passed to e3dc-to-mqtt as command line arguments.
+A file recorded with --record-file replays real payloads instead of simulated ones:
+
+    python -m benchmarks.bench_poll_loop --cycles 1000 -- --replay-file capture.jsonl --replay-speed 0
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from e3dc_to_mqtt.e3dc_to_mqtt_base import E3DC2MQTT
+
+from .fake_e3dc import FakeE3DC
+from .fake_mqtt import FakeMqttClient
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run_benchmark(cycles: int, warmup: int, device_options: dict, app_args: list) -> dict:
+    mqtt_client = FakeMqttClient()
+    runner = E3DC2MQTT(e3dc_factory=FakeE3DC.factory(**device_options), mqtt_client=mqtt_client)
+    args = runner.parse_args(["--mqtt-broker", "localhost", "--e3dc-host", "simulated", "--e3dc-username", "u", "--e3dc-password", "p", "--e3dc-rscpkey", "k", "--topology-file", ""] + app_args)
+    if args is None:
+        raise SystemExit("invalid arguments")
+    await runner.start(args)
+    try:
+        for _ in range(warmup):
+            await runner.scheduler.run_once()
+        runner.mqtt.flush()
+        mqtt_client.reset_counters()
+
+        durations = []
+        failures = 0
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(cycles):
+            start = time.perf_counter()
+            try:
+                await runner.scheduler.run_once()
+                # a cycle ends with its messages handed to the client, not after the flush interval
+                runner.mqtt.flush()
+            except Exception:
+                failures += 1
+            durations.append(time.perf_counter() - start)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+    finally:
+        await runner.stop()
+
+    return {
+        "cycles": cycles,
+        "failed cycles": failures,
+        "cycles/s": cycles / wall,
+        "p50 cycle latency ms": percentile(durations, 0.5) * 1000,
+        "p99 cycle latency ms": percentile(durations, 0.99) * 1000,
+        "messages/cycle": mqtt_client.messages / cycles,
+        "bytes/cycle": mqtt_client.bytes / cycles,
+        "cpu ms/cycle": cpu / cycles * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_poll_loop", description="Benchmark of the e3dc-to-mqtt poll loop against a simulated E3/DC device")
+    parser.add_argument("--cycles", type=int, default=200, help="Number of measured poll cycles")
+    parser.add_argument("--warmup", type=int, default=5, help="Number of poll cycles before measuring")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency of one RSCP round trip in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum deviation from --latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of RSCP round trips which fail")
+    parser.add_argument("--batteries", type=int, default=2, help="Number of simulated batteries")
+    parser.add_argument("--pvi-trackers", type=int, default=2, help="Number of simulated PVI trackers")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the simulated values")
+    parser.add_argument("app_args", nargs=argparse.REMAINDER, help="Arguments for e3dc-to-mqtt, after --")
+    args = parser.parse_args()
+
+    app_args = args.app_args[1:] if args.app_args[:1] == ["--"] else args.app_args
+    device_options = {"latency": args.latency, "jitter": args.jitter, "failure_rate": args.failure_rate, "batteries": args.batteries, "pvi_trackers": args.pvi_trackers, "seed": args.seed}
+
+    logging.getLogger("e3dc-to-mqtt").setLevel(logging.CRITICAL)
+    results = asyncio.get_event_loop().run_until_complete(run_benchmark(args.cycles, args.warmup, device_options, app_args))
+    for name, value in results.items():
+        print(f"{name:>22}: {value:.3f}" if isinstance(value, float) else f"{name:>22}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compares the payload serializers and codecs (size and encoding time) on payloads of a simulated poll cycle.
+
+msgpack and cbor are included if msgpack and cbor2 are installed.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_serializer --iterations 20000
+"""
+import argparse
+import json
+import timeit
+from datetime import date
+
+from e3dc_to_mqtt.dateTimeEncoder import DateTimeEncoder
+from e3dc_to_mqtt.serializer import CborSerializer, MsgpackSerializer, StdlibJsonSerializer, OrjsonSerializer, cbor2, msgpack, orjson
+
+from .fake_e3dc import FakeE3DC
+
+
+def poll_payloads(batteries: int, pvi_trackers: int) -> dict:
+    device = FakeE3DC(batteries=batteries, pvi_trackers=pvi_trackers, seed=1)
+    db_data = device.get_db_data()
+    db_data["date"] = date(2022, 4, 1)
+    return {
+        "live": device.poll(),
+        "power_data": device.get_powermeter_data(),
+        "battery_data": device.get_battery_data(0),
+        "pvi_data": device.get_pvi_data(0),
+        "system_info": device.get_system_info(),
+        "db_data": db_data,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_serializer", description="Micro benchmark of the payload serializers")
+    parser.add_argument("--iterations", type=int, default=10000, help="Serializations per payload and serializer")
+    parser.add_argument("--batteries", type=int, default=1)
+    parser.add_argument("--pvi-trackers", type=int, default=2)
+    args = parser.parse_args()
+
+    serializers = {"json cls=DateTimeEncoder": lambda payload: json.dumps(payload, cls=DateTimeEncoder), "json": StdlibJsonSerializer().dumps}
+    if orjson is not None:
+        serializers["orjson"] = OrjsonSerializer().dumps
+    if msgpack is not None:
+        serializers["msgpack"] = MsgpackSerializer().dumps
+    if cbor2 is not None:
+        serializers["cbor"] = CborSerializer().dumps
+
+    payloads = poll_payloads(args.batteries, args.pvi_trackers)
+    totals = {name: [0, 0.0] for name in serializers}
+    print(f"{'payload':>14} {'serializer':>26} {'bytes':>7} {'us/call':>9}")
+    for payload_name, payload in payloads.items():
+        for serializer_name, dumps in serializers.items():
+            seconds = timeit.timeit(lambda: dumps(payload), number=args.iterations)
+            size = len(dumps(payload))
+            totals[serializer_name][0] += size
+            totals[serializer_name][1] += seconds / args.iterations * 1e6
+            print(f"{payload_name:>14} {serializer_name:>26} {size:>7} {seconds / args.iterations * 1e6:>9.2f}")
+    for serializer_name, (size, micros) in totals.items():
+        print(f"{'cycle':>14} {serializer_name:>26} {size:>7} {micros:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+import random
+import time
+
+from e3dc import E3DC
+from e3dc._e3dc import NotAvailableError, SendError
+from e3dc._RSCPEncryptDecrypt import BLOCK_SIZE
+from e3dc._rscpLib import rscpDecode, rscpEncode, rscpFrame, rscpFrameDecode
+from py3rijndael import ZeroPadding
+
+RSCP_ERR_NOT_AVAILABLE = (6).to_bytes(4, "little")
+
+# payload of one TCP segment, longer answers arrive in several parts
+SEGMENT_SIZE = 1460
+
+
+class FakeRscpConnection:
+    """Stand-in for the RSCP connection of pye3dc (E3DC.rscp), answers all requests of a frame with one round trip.
+
+    Frames are zero padded to the block size like encrypted ones, but not encrypted. Answers are
+    received in parts of at most one TCP segment.
+    """
+
+    def __init__(self, device) -> None:
+        self.device = device
+        self.socket = None
+        self.encdec = self
+        self.__padding = ZeroPadding(BLOCK_SIZE)
+        self.__answer = b""
+
+    def isConnected(self):
+        return self.socket is not None
+
+    def connect(self):
+        self.socket = self
+
+    def disconnect(self):
+        self.socket = None
+
+    def encrypt(self, data):
+        return self.__padding.encode(data)
+
+    def decrypt(self, data):
+        return self.__padding.decode(data)
+
+    def send(self, data):
+        payload = rscpFrameDecode(self.decrypt(data))[0]
+        requests = []
+        offset = 0
+        while offset < len(payload):
+            request, size = rscpDecode(payload[offset:])
+            requests.append(request)
+            offset += size
+        self.__answer = self.encrypt(rscpFrame(b"".join(rscpEncode(response) for response in self.device.answer_frame(requests))))
+
+    def recv(self, size):
+        data = self.__answer[: min(size, SEGMENT_SIZE)]
+        self.__answer = self.__answer[len(data) :]
+        return data
+
+
+class FakeE3DC:
+    """Stand-in for e3dc.E3DC with the payload layout of pye3dc, configurable latency and failures.
+
+    Every public call sleeps latency +/- jitter seconds per simulated RSCP round trip and fails
+    with SendError at the given failure rate. Live, power meter and battery data are read by the
+    code of pye3dc, which sends its requests with sendRequest, so batched polls combine them.
+    """
+
+    CONNECT_LOCAL = 1
+    CONNECT_WEB = 2
+
+    def __init__(self, connectType=CONNECT_LOCAL, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, batteries: int = 1, pvi_trackers: int = 2, seed: int = None, **kwargs) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.num_batteries = batteries
+        self.num_pvi_trackers = pvi_trackers
+        self.random = random.Random(seed)
+        self.round_trips = 0
+        self.rscp = FakeRscpConnection(self)
+        self.serialNumber = "S10-123456789"
+        self.pvis = [{"index": 0, "strings": pvi_trackers}]
+        self.powermeters = [{"index": 0}]
+        self.batteries = [{"index": idx} for idx in range(batteries)]
+        self.lastRequest = None
+        self.__solar = 4000.0
+        self.__house = 600.0
+        self.__soc = 50.0
+        self.get_system_info_static()
+
+    @staticmethod
+    def factory(**options):
+        """Returns a callable with the signature of the E3DC constructor, to be passed as e3dc_factory"""
+        return lambda connectType, **kwargs: FakeE3DC(connectType, **options)
+
+    def __round_trip(self, count: int = 1):
+        for _ in range(count):
+            self.round_trips += 1
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            if self.failure_rate > 0 and self.random.random() < self.failure_rate:
+                raise SendError("Max retries reached")
+
+    def __walk(self):
+        self.__solar = max(0.0, self.__solar + self.random.uniform(-150, 150))
+        self.__house = max(100.0, self.__house + self.random.uniform(-50, 50))
+        self.__soc = min(100.0, max(0.0, self.__soc + self.random.uniform(-0.2, 0.2)))
+
+    def get_system_info_static(self, keepAlive=False):
+        self.__round_trip(6)
+        return True
+
+    def get_system_info(self, keepAlive=False):
+        self.__round_trip()
+        return {
+            "deratePercent": 70,
+            "deratePower": 7000,
+            "externalSourceAvailable": 0,
+            "installedBatteryCapacity": 13800,
+            "installedPeakPower": 10000,
+            "maxAcPower": 12000,
+            "macAddress": "00:11:22:33:44:55",
+            "maxBatChargePower": 6000,
+            "maxBatDischargePower": 6000,
+            "model": "S10E",
+            "release": "S10_2022_04",
+            "serial": self.serialNumber,
+        }
+
+    def poll(self, keepAlive=False):
+        self.__walk()
+        # no answer from the last second, every cycle of a benchmark reads the device
+        self.lastRequest = None
+        return E3DC.poll_rscp(self, keepAlive=keepAlive)
+
+    sendRequestTag = E3DC.sendRequestTag
+    get_powermeter_data = E3DC.get_powermeter_data
+    get_battery_data = E3DC.get_battery_data
+
+    def get_pvi_data(self, pviIndex=None, strings=None, phases=None, keepAlive=False):
+        pviIndex = 0 if pviIndex is None else pviIndex
+        if pviIndex not in [pvi["index"] for pvi in self.pvis]:
+            raise NotAvailableError()
+        strings = range(0, self.num_pvi_trackers) if strings is None else strings
+        phases = range(0, 3) if phases is None else phases
+        self.__round_trip(2 + len(phases) + len(strings))
+
+        string_power = round(self.__solar / self.num_pvi_trackers, 2)
+        data = {
+            "acMaxApparentPower": 12000.0,
+            "cosPhi": {"active": False, "value": 0.0, "excited": 0},
+            "deviceState": {"connected": True, "working": True, "inService": False},
+            "frequency": {"under": 47.5, "over": 51.5},
+            "index": pviIndex,
+            "lastError": 0,
+            "maxPhaseCount": 3,
+            "maxStringCount": 2,
+            "onGrid": True,
+            "phases": {
+                phase: {"power": round(self.__solar / 3, 2), "voltage": 231.0, "current": 5.2, "apparentPower": 1200.0, "reactivePower": 10.0, "energyAll": 9876543.0, "energyGridConsumption": 1234.0}
+                for phase in phases
+            },
+            "powerMode": 1,
+            "serialNumber": "PVI-0001",
+            "state": "OK",
+            "strings": {string: {"power": string_power, "voltage": 540.0, "current": round(string_power / 540, 2), "energyAll": 7654321.0} for string in strings},
+            "systemMode": 2,
+            "temperature": {"max": 80.0, "min": -20.0, "values": [35.2, 36.1]},
+            "type": 3,
+            "version": "3.1.2",
+            "voltageMonitoring": {"thresholdTop": 253.0, "thresholdBottom": 195.0, "slopeUp": 1.0, "slopeDown": 1.0},
+        }
+        return data
+
+    def sendRequest(self, request, retries=3, keepAlive=False):
+        """Answers a request in RSCP tuple format, one round trip per request"""
+        self.__round_trip()
+        # encoded and decoded like a frame of pye3dc, which rounds to the RSCP data types
+        rscpDecode(rscpEncode(request))
+        return rscpDecode(rscpEncode(self.__answer(request)))[0]
+
+    def answer_frame(self, requests: list) -> list:
+        """Answers of all requests of one combined frame, one round trip"""
+        self.__round_trip()
+        responses = []
+        for request in requests:
+            try:
+                responses.append(self.__answer(request))
+            except NotAvailableError:
+                responses.append((request[0], "Error", RSCP_ERR_NOT_AVAILABLE))
+        return responses
+
+    def __answer(self, request):
+        tag, _, tags = request
+        if tag in self.__EMS_TAGS:
+            return self.__answer_ems(tag)
+        if tag == "PM_REQ_DATA":
+            return self.__answer_powermeter(tags)
+        if tag == "BAT_REQ_DATA":
+            return self.__answer_battery(tags)
+        if tag != "PVI_REQ_DATA":
+            raise NotAvailableError()
+        pvi_index = tags[0][2]
+        if pvi_index not in [pvi["index"] for pvi in self.pvis]:
+            raise NotAvailableError()
+
+        string_power = round(self.__solar / self.num_pvi_trackers, 2)
+        indexed_values = {
+            "PVI_REQ_TEMPERATURE": lambda index: [35.2, 36.1][index % 2],
+            "PVI_REQ_AC_POWER": lambda index: round(self.__solar / 3, 2),
+            "PVI_REQ_AC_VOLTAGE": lambda index: 231.0,
+            "PVI_REQ_AC_CURRENT": lambda index: 5.2,
+            "PVI_REQ_AC_APPARENTPOWER": lambda index: 1200.0,
+            "PVI_REQ_AC_REACTIVEPOWER": lambda index: 10.0,
+            "PVI_REQ_AC_ENERGY_ALL": lambda index: 9876543.0,
+            "PVI_REQ_AC_ENERGY_GRID_CONSUMPTION": lambda index: 1234.0,
+            "PVI_REQ_DC_POWER": lambda index: string_power,
+            "PVI_REQ_DC_VOLTAGE": lambda index: 540.0,
+            "PVI_REQ_DC_CURRENT": lambda index: round(string_power / 540, 2),
+            "PVI_REQ_DC_STRING_ENERGY_ALL": lambda index: 7654321.0,
+        }
+        values = {
+            "PVI_REQ_AC_MAX_PHASE_COUNT": ("UChar8", 3),
+            "PVI_REQ_TEMPERATURE_COUNT": ("UChar8", 2),
+            "PVI_REQ_DC_MAX_STRING_COUNT": ("UChar8", 2),
+            "PVI_REQ_USED_STRING_COUNT": ("UChar8", self.num_pvi_trackers),
+            "PVI_REQ_TYPE": ("UChar8", 3),
+            "PVI_REQ_SERIAL_NUMBER": ("CString", "PVI-0001"),
+            "PVI_REQ_VERSION": ("Container", [("PVI_VERSION_MAIN", "CString", "3.1.2")]),
+            "PVI_REQ_ON_GRID": ("Bool", True),
+            "PVI_REQ_STATE": ("CString", "OK"),
+            "PVI_REQ_LAST_ERROR": ("Uint32", 0),
+            "PVI_REQ_POWER_MODE": ("UChar8", 1),
+            "PVI_REQ_SYSTEM_MODE": ("UChar8", 2),
+            "PVI_REQ_MAX_TEMPERATURE": ("Container", [("PVI_INDEX", "Uint16", 0), ("PVI_VALUE", "Float32", 80.0)]),
+            "PVI_REQ_MIN_TEMPERATURE": ("Container", [("PVI_INDEX", "Uint16", 0), ("PVI_VALUE", "Float32", -20.0)]),
+            "PVI_REQ_AC_MAX_APPARENTPOWER": ("Container", [("PVI_INDEX", "Uint16", 0), ("PVI_VALUE", "Float32", 12000.0)]),
+            "PVI_REQ_COS_PHI": ("Container", [("PVI_COS_PHI_IS_AKTIV", "Bool", False), ("PVI_COS_PHI_VALUE", "Float32", 0.0), ("PVI_COS_PHI_EXCITED", "UChar8", 0)]),
+            "PVI_REQ_FREQUENCY_UNDER_OVER": ("Container", [("PVI_FREQUENCY_UNDER", "Float32", 47.5), ("PVI_FREQUENCY_OVER", "Float32", 51.5)]),
+            "PVI_REQ_VOLTAGE_MONITORING": (
+                "Container",
+                [
+                    ("PVI_VOLTAGE_MONITORING_THRESHOLD_TOP", "Float32", 253.0),
+                    ("PVI_VOLTAGE_MONITORING_THRESHOLD_BOTTOM", "Float32", 195.0),
+                    ("PVI_VOLTAGE_MONITORING_SLOPE_UP", "Float32", 1.0),
+                    ("PVI_VOLTAGE_MONITORING_SLOPE_DOWN", "Float32", 1.0),
+                ],
+            ),
+            "PVI_REQ_DEVICE_STATE": ("Container", [("PVI_DEVICE_CONNECTED", "Bool", True), ("PVI_DEVICE_WORKING", "Bool", True), ("PVI_DEVICE_IN_SERVICE", "Bool", False)]),
+        }
+        response = [("PVI_INDEX", "Uint16", pvi_index)]
+        for request_tag, _, value in tags[1:]:
+            tag = request_tag.replace("PVI_REQ_", "PVI_", 1)
+            if request_tag in indexed_values:
+                response.append((tag, "Container", [("PVI_INDEX", "Uint16", value), ("PVI_VALUE", "Float32", indexed_values[request_tag](value))]))
+            elif request_tag in values:
+                response.append((tag,) + values[request_tag])
+        return ("PVI_DATA", "Container", response)
+
+    __EMS_TAGS = [
+        "INFO_REQ_UTC_TIME",
+        "EMS_REQ_BAT_SOC",
+        "EMS_REQ_POWER_PV",
+        "EMS_REQ_POWER_ADD",
+        "EMS_REQ_POWER_BAT",
+        "EMS_REQ_POWER_HOME",
+        "EMS_REQ_POWER_GRID",
+        "EMS_REQ_POWER_WB_ALL",
+        "EMS_REQ_SELF_CONSUMPTION",
+        "EMS_REQ_AUTARKY",
+    ]
+
+    def __answer_ems(self, request_tag: str):
+        values = {
+            "INFO_REQ_UTC_TIME": ("Uint64", int(time.time())),
+            "EMS_REQ_BAT_SOC": ("UChar8", round(self.__soc)),
+            "EMS_REQ_POWER_PV": ("Int32", round(self.__solar)),
+            "EMS_REQ_POWER_ADD": ("Int32", 0),
+            "EMS_REQ_POWER_BAT": ("Int32", round(self.__solar - self.__house)),
+            "EMS_REQ_POWER_HOME": ("Int32", round(self.__house)),
+            "EMS_REQ_POWER_GRID": ("Int32", 0),
+            "EMS_REQ_POWER_WB_ALL": ("Int32", 0),
+            "EMS_REQ_SELF_CONSUMPTION": ("Float32", 100.0),
+            "EMS_REQ_AUTARKY": ("Float32", 100.0),
+        }
+        return (request_tag.replace("_REQ_", "_", 1),) + values[request_tag]
+
+    def __answer_powermeter(self, tags: list):
+        pm_index = tags[0][2]
+        if pm_index not in [powermeter["index"] for powermeter in self.powermeters]:
+            raise NotAvailableError()
+        house = round(self.__house / 3)
+        values = {
+            "PM_REQ_POWER_L1": ("Double64", house),
+            "PM_REQ_POWER_L2": ("Double64", house + 12),
+            "PM_REQ_POWER_L3": ("Double64", house - 7),
+            "PM_REQ_VOLTAGE_L1": ("Float32", 231.2),
+            "PM_REQ_VOLTAGE_L2": ("Float32", 230.8),
+            "PM_REQ_VOLTAGE_L3": ("Float32", 232.1),
+            "PM_REQ_ENERGY_L1": ("Double64", 1234567.0),
+            "PM_REQ_ENERGY_L2": ("Double64", 2345678.0),
+            "PM_REQ_ENERGY_L3": ("Double64", 3456789.0),
+            "PM_REQ_MAX_PHASE_POWER": ("Double64", 8000.0),
+            "PM_REQ_ACTIVE_PHASES": ("Int32", 0b111),
+            "PM_REQ_TYPE": ("UChar8", 1),
+            "PM_REQ_MODE": ("UChar8", 1),
+        }
+        response = [("PM_INDEX", "Uint16", pm_index)]
+        for request_tag, _, _ in tags[1:]:
+            if request_tag in values:
+                response.append((request_tag.replace("PM_REQ_", "PM_", 1),) + values[request_tag])
+        return ("PM_DATA", "Container", response)
+
+    def __answer_battery(self, tags: list):
+        bat_index = tags[0][2]
+        if bat_index >= self.num_batteries:
+            raise NotAvailableError()
+        soc = round(self.__soc, 1)
+        values = {
+            "BAT_REQ_ASOC": ("Float32", soc),
+            "BAT_REQ_CHARGE_CYCLES": ("Uint32", 412),
+            "BAT_REQ_CURRENT": ("Float32", round(self.random.uniform(-20, 20), 2)),
+            "BAT_REQ_DCB_COUNT": ("UChar8", 1),
+            "BAT_REQ_DESIGN_CAPACITY": ("Float32", 27.0),
+            "BAT_REQ_DEVICE_NAME": ("CString", "BAT_INT"),
+            "BAT_REQ_DEVICE_STATE": ("Container", [("BAT_DEVICE_CONNECTED", "Bool", True), ("BAT_DEVICE_WORKING", "Bool", True), ("BAT_DEVICE_IN_SERVICE", "Bool", False)]),
+            "BAT_REQ_EOD_VOLTAGE": ("Float32", 45.6),
+            "BAT_REQ_ERROR_CODE": ("Uint32", 0),
+            "BAT_REQ_FCC": ("Float32", 26.1),
+            "BAT_REQ_MAX_BAT_VOLTAGE": ("Float32", 58.8),
+            "BAT_REQ_MAX_CHARGE_CURRENT": ("Float32", 90.0),
+            "BAT_REQ_MAX_DISCHARGE_CURRENT": ("Float32", 90.0),
+            "BAT_REQ_MAX_DCB_CELL_TEMPERATURE": ("Float32", 22.3),
+            "BAT_REQ_MIN_DCB_CELL_TEMPERATURE": ("Float32", 21.5),
+            "BAT_REQ_INTERNALS": ("Container", [("BAT_MEASURED_RESISTANCE", "Double64", 0.0021), ("BAT_RUN_MEASURED_RESISTANCE", "Double64", 0.0023)]),
+            "BAT_REQ_MODULE_VOLTAGE": ("Float32", 52.4),
+            "BAT_REQ_RC": ("Float32", round(26.1 * soc / 100, 2)),
+            "BAT_REQ_READY_FOR_SHUTDOWN": ("Bool", False),
+            "BAT_REQ_RSOC": ("Float32", soc),
+            "BAT_REQ_RSOC_REAL": ("Float32", soc),
+            "BAT_REQ_STATUS_CODE": ("Uint32", 0),
+            "BAT_REQ_TERMINAL_VOLTAGE": ("Float32", 52.3),
+            "BAT_REQ_TOTAL_USE_TIME": ("Uint64", 12345678),
+            "BAT_REQ_TOTAL_DISCHARGE_TIME": ("Uint64", 2345678),
+            "BAT_REQ_TRAINING_MODE": ("UChar8", 0),
+            "BAT_REQ_USABLE_CAPACITY": ("Float32", 24.8),
+            "BAT_REQ_USABLE_REMAINING_CAPACITY": ("Float32", round(24.8 * soc / 100, 2)),
+        }
+        dcb_values = {
+            "BAT_REQ_DCB_ALL_CELL_TEMPERATURES": lambda dcb: [("BAT_DCB_CELL_TEMPERATURE", "Float32", value) for value in [21.5, 21.9, 22.0, 22.3]],
+            "BAT_REQ_DCB_ALL_CELL_VOLTAGES": lambda dcb: [("BAT_DCB_CELL_VOLTAGE", "Float32", value) for value in [3.27, 3.28] * 4],
+            "BAT_REQ_DCB_INFO": lambda dcb: [
+                ("BAT_DCB_CURRENT", "Double64", 1.2),
+                ("BAT_DCB_CURRENT_AVG_30S", "Double64", 1.1),
+                ("BAT_DCB_CYCLE_COUNT", "Uint32", 412),
+                ("BAT_DCB_DESIGN_CAPACITY", "Double64", 27.0),
+                ("BAT_DCB_DESIGN_VOLTAGE", "Double64", 51.8),
+                ("BAT_DCB_DEVICE_NAME", "CString", "DCB-0001"),
+                ("BAT_DCB_END_OF_DISCHARGE", "Double64", 45.6),
+                ("BAT_DCB_ERROR", "Uint32", 0),
+                ("BAT_DCB_FULL_CHARGE_CAPACITY", "Double64", 26.1),
+                ("BAT_DCB_FW_VERSION", "Uint32", 4711),
+                ("BAT_DCB_MANUFACTURE_DATE", "Uint32", 1546300800),
+                ("BAT_DCB_MANUFACTURE_NAME", "CString", "E3/DC"),
+                ("BAT_DCB_MAX_CHARGE_CURRENT", "Double64", 90.0),
+                ("BAT_DCB_CHARGE_HIGH_TEMPERATURE", "Double64", 45.0),
+                ("BAT_DCB_MAX_CHARGE_VOLTAGE", "Double64", 58.8),
+                ("BAT_DCB_MAX_DISCHARGE_CURRENT", "Double64", 90.0),
+                ("BAT_DCB_CHARGE_LOW_TEMPERATURE", "Double64", 0.0),
+                ("BAT_DCB_NR_PARALLEL_CELL", "Uint16", 1),
+                ("BAT_DCB_NR_SENSOR", "Uint16", 4),
+                ("BAT_DCB_NR_SERIES_CELL", "Uint16", 8),
+                ("BAT_DCB_PCB_VERSION", "Uint32", 3),
+                ("BAT_DCB_PROTOCOL_VERSION", "Uint32", 2),
+                ("BAT_DCB_REMAINING_CAPACITY", "Double64", round(26.1 * soc / 100, 2)),
+                ("BAT_DCB_SERIALCODE", "CString", "DCB-0001-0001"),
+                ("BAT_DCB_SERIALNO", "Uint32", 1),
+                ("BAT_DCB_SOC", "Double64", soc),
+                ("BAT_DCB_SOH", "Double64", 96.7),
+                ("BAT_DCB_STATUS", "Uint32", 0),
+                ("BAT_DCB_VOLTAGE", "Double64", 52.4),
+                ("BAT_DCB_VOLTAGE_AVG_30S", "Double64", 52.4),
+                ("BAT_DCB_WARNING", "Uint32", 0),
+            ],
+        }
+        response = [("BAT_INDEX", "Uint16", bat_index)]
+        for request_tag, _, value in tags[1:]:
+            tag = request_tag.replace("BAT_REQ_", "BAT_", 1)
+            if request_tag in dcb_values:
+                if value != 0:
+                    raise NotAvailableError()  # one DCB per battery
+                content = [("BAT_DCB_INDEX", "Uint16", value)] + dcb_values[request_tag](value)
+                if request_tag != "BAT_REQ_DCB_INFO":
+                    content = [("BAT_DCB_INDEX", "Uint16", value), ("BAT_DATA", "Container", content[1:])]
+                response.append((tag, "Container", content))
+            elif request_tag in values:
+                response.append((tag,) + values[request_tag])
+        return ("BAT_DATA", "Container", response)
+
+    def get_db_data(self, startDate=None, timespan="DAY", keepAlive=False):
+        self.__round_trip()
+        return {
+            "autarky": 87.3,
+            "bat_power_in": 5400.0,
+            "bat_power_out": 5100.0,
+            "consumed_production": 64.1,
+            "consumption": 11200.0,
+            "grid_power_in": 1400.0,
+            "grid_power_out": 9800.0,
+            "stateOfCharge": 48.0,
+            "solarProduction": 23400.0,
+        }
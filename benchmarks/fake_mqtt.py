@@ -0,0 +1,72 @@
+import paho.mqtt.client as mqtt
+
+
+class FakeMqttClient:
+    """In-process stand-in for paho.mqtt.client.Client which connects on the first loop_misc call and counts what is published."""
+
+    def __init__(self) -> None:
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.messages = 0
+        self.bytes = 0
+        self.last_payload_by_topic = {}
+        self.__callbacks = {}
+        self.__connecting = False
+
+    def reset_counters(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def connect(self, host, port=1883, keepalive=60, *args, **kwargs):
+        self.__connecting = True
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_misc(self):
+        if self.__connecting:
+            self.__connecting = False
+            self.on_connect(self, None, {}, 0, None)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def want_write(self) -> bool:
+        return False
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+    def subscribe(self, topic, *args, **kwargs):
+        return (mqtt.MQTT_ERR_SUCCESS, 0)
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        return (mqtt.MQTT_ERR_SUCCESS, 0)
+
+    def message_callback_add(self, sub, callback):
+        self.__callbacks[sub] = callback
+
+    def message_callback_remove(self, sub):
+        self.__callbacks.pop(sub, None)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode("ascii")
+        self.messages += 1
+        self.bytes += len(payload)
+        self.last_payload_by_topic[topic] = payload
+        return mqtt.MQTTMessageInfo(self.messages)
+
+    def deliver(self, topic: str, payload: bytes, properties=None):
+        """Simulates an incoming message from the broker"""
+        msg = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        msg.payload = payload
+        if properties is not None:
+            msg.properties = properties
+        for sub, callback in list(self.__callbacks.items()):
+            if mqtt.topic_matches_sub(sub, topic):
+                callback(self, None, msg)
@@ -1,17 +1,34 @@
 import asyncio
 import re
+import threading
 import paho.mqtt.client as mqtt
 from paho.mqtt.packettypes import PacketTypes
 import json
+from datetime import datetime, timezone
 
 from events import Events
 
 from .dateTimeEncoder import DateTimeEncoder
+from .metrics import REGISTRY
+from .publish_queue import FLUSHES, OutboundMessage, PublishQueue
+from .serializer import JSON_CONTENT_TYPE, get_serializer, get_serializer_for_content_type
+
+PUBLISH_DURATION = REGISTRY.histogram("mqtt_publish_duration_seconds", "Time needed to serialize and queue a message")
+PUBLISHED_MESSAGES = REGISTRY.counter("mqtt_published_messages_total", "Messages published")
+PUBLISHED_BYTES = REGISTRY.counter("mqtt_published_bytes_total", "Payload bytes published")
+
+MISC_INTERVAL = 1.0  # keep-alive and timeout handling of paho, see Client.loop_misc
+MIN_RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_QUEUE_BYTES = 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.1
 
 
 class Payload(object):
-    def __init__(self, j):
-        self.__dict__ = json.loads(j)
+    def __init__(self, j, serializer=None):
+        self.__dict__ = json.loads(j) if serializer is None else serializer.loads(j)
         self.input_string = j
 
     def get_input(self):
@@ -19,21 +36,51 @@ class Payload(object):
 
 
 class Subscription:
-    def __init__(self, topic: str, callback):
+    def __init__(self, topic: str, callback, basetopic: str = None):
         self.topic = topic
         self.callback = callback
+        self.basetopic = basetopic
 
 
 class MqttClient:
+    """Connection to the MQTT broker, driven by the asyncio event loop instead of a paho network thread.
+
+    The socket of paho is registered with the loop's reader and writer callbacks, so messages are
+    read, written and delivered to the subscription callbacks on the loop. Only connecting, which
+    blocks on DNS and the TCP handshake, runs in the default executor.
+
+    Published messages go to a bounded PublishQueue first. flush_interval seconds after the first
+    message of a poll, the queue is handed to paho as one batch, unless paho has not written the
+    previous batch yet. Then the queue fills up, coalescing topics, and is_congested tells the
+    poll loop to slow down.
+    """
+
     Instance = None  # type: MqttClient
 
-    def __init__(self, logger, loop, broker: str, port: int, clientId: str, keepAlive: int, username: str, password: str, basetopic: str) -> None:
+    def __init__(
+        self,
+        logger,
+        loop,
+        broker: str,
+        port: int,
+        clientId: str,
+        keepAlive: int,
+        username: str,
+        password: str,
+        basetopic: str,
+        client: mqtt.Client = None,
+        serializer=None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        queue_bytes: int = DEFAULT_QUEUE_BYTES,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ) -> None:
         MqttClient.Instance = self
 
         self.logger = logger
         self.loop = loop
         self.broker = broker
         self.port = port
+        self.keepalive = keepAlive
         self.basetopic = basetopic
         self.username = username
         self.password = password
@@ -43,72 +90,212 @@ class MqttClient:
         self.is_started = False
         client_id = clientId if clientId is not None else "e3dc-to-mqtt"
         self.logger.debug(f"using client_id {client_id}")
-        self.client = mqtt.Client(client_id, protocol=mqtt.MQTTv5)
+        self.serializer = serializer if serializer is not None else get_serializer()
+        self.__serializers_by_content_type = {}
+        self.client = client if client is not None else mqtt.Client(client_id, protocol=mqtt.MQTTv5)
         self.connect_event = asyncio.Event()
+        self.__stop_event = asyncio.Event()
+        self.__socket_closed = asyncio.Event()
+        self.__socket = None
+        self.__loop_thread = None
+        self.queue = PublishQueue(queue_size, queue_bytes)
+        self.flush_interval = flush_interval
+        self.__flush_handle = None  # type: asyncio.TimerHandle
 
         self.events = Events()
 
         self.current_base_subscription = ""
+        self.scope_basetopics = []
 
         self.subscriptions = []
+        self.publish_topics = {}
         self.callbacks_by_topic = {}
 
         self.is_connected = False
 
+    @property
+    def is_congested(self) -> bool:
+        return self.queue.is_full
+
     async def start(self):
         if self.is_started:
             return
 
+        self.is_started = True
+        self.__loop_thread = threading.get_ident()
         self.client.username_pw_set(self.username, self.password)
         self.client.on_connect = self.__on_connect
         self.client.on_disconnect = self.__on_disconnect
         self.client.on_message = self.__on_message
-        self.logger.debug(f"connect to {self.broker} as user {self.port}")
-        self.client.connect_async(self.broker)
-        self.client.loop_start()
+        self.client.on_socket_open = self.__on_socket_open
+        self.client.on_socket_close = self.__on_socket_close
+        self.client.on_socket_register_write = self.__on_socket_register_write
+        self.client.on_socket_unregister_write = self.__on_socket_unregister_write
 
         self.run_task = asyncio.ensure_future(self.run())
 
         await self.connect_event.wait()
 
     async def run(self):
+        """Connects and keeps reconnecting with increasing delay until stop is called"""
+        delay = MIN_RECONNECT_DELAY
         while not self.stop_requested:
+            self.logger.debug(f"connect to {self.broker}:{self.port}")
             try:
-                await asyncio.sleep(0.2)
-            except asyncio.CancelledError:
-                self.logger.error("cancelled error")
-                break
-            except KeyboardInterrupt:
-                self.logger.error("keyboard interrupt")
-                break
-
+                await self.loop.run_in_executor(None, self.client.connect, self.broker, self.port, self.keepalive)
+            except Exception as e:
+                self.logger.error(f"failed to connect to {self.broker}:{self.port}: {e}")
+            else:
+                delay = MIN_RECONNECT_DELAY
+                while not self.stop_requested and self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                    await self.__wait_for_stop(MISC_INTERVAL)
+            if not self.stop_requested:
+                await self.__wait_for_stop(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+        if self.__flush_handle is not None:
+            self.__flush_handle.cancel()
+            self.__flush_handle = None
+        if self.is_connected:
+            self.__hand_over()
         self.client.disconnect()
+        if self.__socket is not None:
+            # the DISCONNECT packet is written by the loop, paho closes the socket afterwards
+            try:
+                await asyncio.wait_for(self.__socket_closed.wait(), MISC_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
 
-    def publish(self, topic, payload=None, qos=0, retain=False):
-        topic = topic.lstrip("/")
-        publish_topic = f"{self.basetopic}{topic}"
-        if payload is None:
-            self.client.publish(publish_topic, "", qos, retain)
-        elif type(payload) is list:
-            self.client.publish(publish_topic, json.dumps(payload, cls=DateTimeEncoder), qos, retain)
-        elif not type(payload) is dict:
-            self.client.publish(publish_topic, payload, qos, retain)
+    async def __wait_for_stop(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.__stop_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def __on_socket_open(self, client, userdata, sock):
+        self.__call_on_loop(self.__add_socket, sock)
+
+    def __add_socket(self, sock):
+        self.__socket = sock
+        self.__socket_closed.clear()
+        self.loop.add_reader(sock, self.client.loop_read)
+
+    def __on_socket_close(self, client, userdata, sock):
+        self.__call_on_loop(self.__remove_socket, sock)
+
+    def __remove_socket(self, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        self.__socket = None
+        self.__socket_closed.set()
+
+    def __on_socket_register_write(self, client, userdata, sock):
+        self.__call_on_loop(self.loop.add_writer, sock, self.client.loop_write)
+
+    def __on_socket_unregister_write(self, client, userdata, sock):
+        self.__call_on_loop(self.__writes_done, sock)
+
+    def __writes_done(self, sock):
+        self.loop.remove_writer(sock)
+        if len(self.queue) > 0:
+            self.__schedule_flush()
+
+    def __call_on_loop(self, callback, *args):
+        # paho calls back from the executor while connecting, everything else happens on the loop
+        if threading.get_ident() == self.__loop_thread:
+            callback(*args)
         else:
-            json_payload = json.dumps(payload, cls=DateTimeEncoder)
-            self.client.publish(publish_topic, json_payload, qos, retain)
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, timestamp: float = None, codec=None):
+        publish_topic = self.publish_topics.get(topic)
+        if publish_topic is None:
+            publish_topic = f"{self.basetopic}{topic.lstrip('/')}"
+            self.publish_topics[topic] = publish_topic
+        self.publish_to(publish_topic, payload, qos, retain, timestamp, codec)
+
+    def publish_to(self, publish_topic: str, payload=None, qos=0, retain=False, timestamp: float = None, codec=None):
+        """Like publish, but publish_topic is used as given (without basetopic).
+
+        Dicts and lists are encoded with codec, default is the JSON serializer. Payloads of other
+        codecs carry their MQTT v5 content type. Scalars are published as text.
+        """
+        serializer = codec if codec is not None else self.serializer
+        props = None
+        if timestamp is not None:
+            # time the value was sampled, set when publishing buffered values later
+            props = mqtt.Properties(PacketTypes.PUBLISH)
+            props.UserProperty = ("timestamp", datetime.fromtimestamp(timestamp, timezone.utc).isoformat())
+        with PUBLISH_DURATION.time():
+            if payload is None:
+                data = ""
+            elif type(payload) is dict or type(payload) is list:
+                data = serializer.dumps(payload)
+                if serializer.content_type != JSON_CONTENT_TYPE:
+                    props = props if props is not None else mqtt.Properties(PacketTypes.PUBLISH)
+                    props.ContentType = serializer.content_type
+            elif type(payload) is bool:
+                # scalars are text whatever the codec, true and false as in JSON
+                data = self.serializer.dumps(payload)
+            else:
+                data = payload
+            # buffered samples are replayed one after another, each of them has to be published
+            self.queue.put(OutboundMessage(publish_topic, data, qos, retain, props), coalesce=timestamp is None)
+        self.__schedule_flush()
+
+    def __schedule_flush(self):
+        if self.__flush_handle is None:
+            self.__flush_handle = self.loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """Hands the queued messages to paho, unless it is not connected or still writing the previous batch"""
+        if self.__flush_handle is not None:
+            self.__flush_handle.cancel()  # no-op when called by the handle itself
+            self.__flush_handle = None
+        if not self.is_connected or self.client.want_write():
+            return  # flushed again when connected or paho has written everything
+        self.__hand_over()
+
+    def __hand_over(self):
+        if len(self.queue) == 0:
+            return
+        while len(self.queue) > 0:
+            message = self.queue.pop()
+            self.client.publish(message.topic, message.data, message.qos, message.retain, message.properties)
+            PUBLISHED_MESSAGES.inc()
+            PUBLISHED_BYTES.inc(message.size)
+        FLUSHES.inc()
 
     def publish_raw(self, topic, payload, qos=0, retain=False):
-        json_payload = json.dumps(payload, cls=DateTimeEncoder)
+        json_payload = self.serializer.dumps(payload)
         self.client.publish(topic, json_payload, qos, retain)
 
-    def subscribe_to(self, topic: str, callback):
+    def publish_response(self, response_topic: str, correlation_data: bytes, payload, status: str = "ok", content_type: str = None):
+        """Reply to an MQTT v5 request, response_topic is used as given (without basetopic).
+
+        The payload is encoded in content_type, the one of the request, if it is known, otherwise as JSON.
+        """
+        serializer = self.serializer_for(content_type)
+        props = mqtt.Properties(PacketTypes.PUBLISH)
+        if correlation_data is not None:
+            props.CorrelationData = correlation_data
+        props.UserProperty = ("status", status)
+        if serializer.content_type != JSON_CONTENT_TYPE:
+            props.ContentType = serializer.content_type
+        with PUBLISH_DURATION.time():
+            data = payload if isinstance(payload, (str, bytes, bytearray)) else serializer.dumps(payload)
+            self.client.publish(response_topic, data, 1, False, props)
+        PUBLISHED_MESSAGES.inc()
+        PUBLISHED_BYTES.inc(len(data))
+
+    def subscribe_to(self, topic: str, callback, basetopic: str = None):
         topic = topic.lstrip("/")
-        subscription = Subscription(topic, callback)
+        subscription = Subscription(topic, callback, basetopic if basetopic is not None else self.basetopic)
         self.subscriptions.append(subscription)
         self.__subscribe_internal(subscription)
 
     def __subscribe_internal(self, subscription: Subscription):
-        subscription_topic = f"{self.basetopic}{subscription.topic}"
+        subscription_topic = f"{subscription.basetopic}{subscription.topic}"
         self.logger.debug(f"subscribed to {subscription_topic}")
 
         if subscription_topic not in self.callbacks_by_topic:
@@ -131,6 +318,7 @@ class MqttClient:
     async def stop(self):
         self.logger.debug(f"stopping")
         self.stop_requested = True
+        self.__stop_event.set()
         await self.run_task
         self.logger.debug(f"stopped")
 
@@ -146,18 +334,33 @@ class MqttClient:
             self.__subscribe_base_topic()
             self.connect_event.set()
             self.events.connected()
+            if len(self.queue) > 0:
+                self.__schedule_flush()
         else:
             self.logger.error("Failed to connect to mqtt broker, return code {:d}".format(rc))
 
     def __subscribe_base_topic(self):
         self.current_base_subscription = self.basetopic + "#"
         self.client.subscribe(self.current_base_subscription)
+        for basetopic in self.scope_basetopics:
+            self.client.subscribe(basetopic + "#")
+
+    def scope(self, basetopic: str):
+        """Returns a view on this client which publishes and subscribes below basetopic"""
+        if not basetopic.startswith(self.basetopic) and basetopic not in self.scope_basetopics:
+            # topics below the own base topic are covered by its subscription already
+            self.scope_basetopics.append(basetopic)
+            if self.is_connected:
+                self.client.subscribe(basetopic + "#")
+        return MqttScope(self, basetopic)
 
     def __on_message(self, client, userdata, msg):
         pass  # unhandled message, could be logged here
 
     def resubscribe(self):
         self.client.unsubscribe(self.current_base_subscription)
+        for basetopic in self.scope_basetopics:
+            self.client.unsubscribe(basetopic + "#")
         for sub in self.callbacks_by_topic.keys():
             self.client.message_callback_remove(sub)
         self.callbacks_by_topic.clear()
@@ -168,13 +371,72 @@ class MqttClient:
         for sub in self.subscriptions:
             self.__subscribe_internal(sub)
 
+    def serializer_for(self, content_type: str):
+        """Serializer of an MQTT v5 content type, the JSON serializer for messages without or with an unknown content type"""
+        if content_type is None or content_type == JSON_CONTENT_TYPE:
+            return self.serializer
+        if content_type not in self.__serializers_by_content_type:
+            self.__serializers_by_content_type[content_type] = get_serializer_for_content_type(content_type) or self.serializer
+        return self.__serializers_by_content_type[content_type]
+
     def parse_payload(self, msg, topic):
         try:
             if type(msg.payload) is not Payload:
-                self.parse_json(msg)
+                content_type = getattr(getattr(msg, "properties", None), "ContentType", None)
+                if content_type is None:
+                    self.parse_json(msg)
+                else:
+                    msg.payload = Payload(msg.payload, self.serializer_for(content_type))
         except Exception as e:
             self.logger.error(f"exception parsing payload on topic {topic}: {msg.payload}, {e}")
 
     @staticmethod
     def parse_json(msg):
         msg.payload = Payload(msg.payload.decode("utf-8"))
+
+
+class MqttScope:
+    """Publishes and subscribes below its own base topic, using the connection of a shared MqttClient.
+
+    The shared client is started and stopped by its owner, start and stop of a scope only wait for it.
+    """
+
+    def __init__(self, client: MqttClient, basetopic: str) -> None:
+        self.client = client
+        self.basetopic = basetopic
+        self.publish_topics = {}
+
+    @property
+    def is_connected(self) -> bool:
+        return self.client.is_connected
+
+    @property
+    def is_congested(self) -> bool:
+        return self.client.is_congested
+
+    @property
+    def events(self) -> Events:
+        return self.client.events
+
+    @property
+    def serializer(self):
+        return self.client.serializer
+
+    async def start(self):
+        await self.client.connect_event.wait()
+
+    async def stop(self):
+        pass
+
+    def publish(self, topic, payload=None, qos=0, retain=False, timestamp: float = None, codec=None):
+        publish_topic = self.publish_topics.get(topic)
+        if publish_topic is None:
+            publish_topic = f"{self.basetopic}{topic.lstrip('/')}"
+            self.publish_topics[topic] = publish_topic
+        self.client.publish_to(publish_topic, payload, qos, retain, timestamp, codec)
+
+    def publish_response(self, response_topic: str, correlation_data: bytes, payload, status: str = "ok", content_type: str = None):
+        self.client.publish_response(response_topic, correlation_data, payload, status, content_type)
+
+    def subscribe_to(self, topic: str, callback):
+        self.client.subscribe_to(topic, callback, self.basetopic)
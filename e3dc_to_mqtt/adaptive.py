@@ -0,0 +1,31 @@
+from .aggregation import numeric_leaves
+
+
+class AdaptiveInterval:
+    """Poll interval following how fast power values change.
+
+    After every sample, the largest change of a power value since the previous sample is
+    compared to threshold (W). A change of at least threshold halves the interval, down to
+    minimum. A change below half the threshold stretches it by a quarter, up to maximum.
+    So transients are followed within a few polls, while a flat night slowly backs off.
+    """
+
+    def __init__(self, interval: float, minimum: float, maximum: float, threshold: float, prefixes: list) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.threshold = threshold
+        self.prefixes = list(prefixes)
+        self.interval = min(maximum, max(minimum, interval))
+        self.__last = None  # type: dict[tuple, float]
+
+    def update(self, payload) -> float:
+        """Takes a sample, returns the interval until the next one"""
+        values = {path: value for path, value in numeric_leaves(payload) if any(path[: len(prefix)] == prefix for prefix in self.prefixes)}
+        if self.__last is not None:
+            change = max((abs(value - self.__last[path]) for path, value in values.items() if path in self.__last), default=0.0)
+            if change >= self.threshold:
+                self.interval = max(self.minimum, self.interval / 2)
+            elif change < self.threshold / 2:
+                self.interval = min(self.maximum, self.interval * 1.25)
+        self.__last = values
+        return self.interval
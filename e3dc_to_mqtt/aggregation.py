@@ -0,0 +1,154 @@
+import math
+from array import array
+from datetime import datetime, timezone
+
+# values below these paths are powers in W, their energy is integrated
+ENERGY_PREFIXES = {
+    "live": [("consumption",), ("production",)],
+    "power_data": [("power",)],
+}
+
+# measured values below these paths are aggregated, other values like index, type or mode are
+# identifiers or states and are passed through with their last value
+MEASUREMENT_PREFIXES = {
+    "live": [("autarky",), ("consumption",), ("production",), ("selfConsumption",), ("stateOfCharge",)],
+    "power_data": [("energy",), ("power",), ("voltage",)],
+}
+
+
+def numeric_leaves(payload, path: tuple = ()):
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            yield from numeric_leaves(value, path + (key,))
+    elif isinstance(payload, (int, float)) and not isinstance(payload, bool):
+        yield path, payload
+
+
+class WindowAggregator:
+    """Min, max, mean and energy of every numeric value of a payload over windows of fixed length.
+
+    Windows are aligned to the clock, e.g. 60 s windows start at full minutes. Every value has one
+    slot in each of a few arrays, so memory does not grow with the number of samples in a window.
+    Energy in Wh is integrated for power values, holding each sample until the next one. Gaps
+    longer than max_gap (default: one window) are not integrated. With measurement_prefixes, only
+    values below these paths are aggregated, the summary holds the last value of any other one.
+    """
+
+    def __init__(self, window: float, energy_prefixes: list = (), max_gap: float = None, measurement_prefixes: list = None) -> None:
+        self.window = window
+        self.name = f"{window:g}"
+        self.energy_prefixes = list(energy_prefixes)
+        self.max_gap = window if max_gap is None else max_gap
+        self.measurement_prefixes = None if measurement_prefixes is None else list(measurement_prefixes)
+        self.__passed = {}  # type: dict[tuple, float]
+        self.__not_measured = set()
+        self.__paths = []
+        self.__slots = {}  # type: dict[tuple, int]
+        self.__has_energy = array("b")
+        self.__minimum = array("d")
+        self.__maximum = array("d")
+        self.__total = array("d")
+        self.__count = array("L")
+        self.__energy = array("d")
+        self.__last_value = array("d")
+        self.__last_time = array("d")
+        self.__start = None
+        self.__samples = 0
+
+    def add(self, timestamp: float, payload) -> dict:
+        """Adds a sample taken at timestamp (seconds since epoch), returns the aggregate of the window it closed or None"""
+        closed = None
+        if self.__start is None:
+            self.__start = self.__window_start(timestamp)
+        elif timestamp >= self.__start + self.window:
+            closed = self.__close(timestamp)
+
+        for path, value in numeric_leaves(payload):
+            slot = self.__slots.get(path)
+            if slot is None:
+                if path in self.__not_measured or not self.__is_measurement(path):
+                    self.__not_measured.add(path)
+                    self.__passed[path] = value
+                    continue
+                slot = self.__add_slot(path)
+            if self.__has_energy[slot] and 0 <= timestamp - self.__last_time[slot] <= self.max_gap:
+                self.__energy[slot] += self.__last_value[slot] * (timestamp - self.__last_time[slot]) / 3600
+            self.__minimum[slot] = min(self.__minimum[slot], value)
+            self.__maximum[slot] = max(self.__maximum[slot], value)
+            self.__total[slot] += value
+            self.__count[slot] += 1
+            self.__last_value[slot] = value
+            self.__last_time[slot] = timestamp
+        self.__samples += 1
+        return closed
+
+    def __is_measurement(self, path: tuple) -> bool:
+        if self.measurement_prefixes is None:
+            return True
+        return any(path[: len(prefix)] == prefix for prefix in self.measurement_prefixes)
+
+    def __add_slot(self, path: tuple) -> int:
+        slot = len(self.__paths)
+        self.__paths.append(path)
+        self.__slots[path] = slot
+        self.__has_energy.append(any(path[: len(prefix)] == prefix for prefix in self.energy_prefixes))
+        self.__minimum.append(math.inf)
+        self.__maximum.append(-math.inf)
+        self.__total.append(0.0)
+        self.__count.append(0)
+        self.__energy.append(0.0)
+        self.__last_value.append(0.0)
+        self.__last_time.append(-math.inf)
+        return slot
+
+    def __window_start(self, timestamp: float) -> float:
+        return math.floor(timestamp / self.window) * self.window
+
+    def __close(self, timestamp: float) -> dict:
+        end = self.__start + self.window
+        for slot in range(len(self.__paths)):
+            # the held value counts for the closed window up to its end, the rest goes to the next one
+            if self.__has_energy[slot] and 0 <= timestamp - self.__last_time[slot] <= self.max_gap:
+                self.__energy[slot] += self.__last_value[slot] * (end - self.__last_time[slot]) / 3600
+                self.__last_time[slot] = end
+
+        summary = self.__summary(end)
+        for slot in range(len(self.__paths)):
+            self.__minimum[slot] = math.inf
+            self.__maximum[slot] = -math.inf
+            self.__total[slot] = 0.0
+            self.__count[slot] = 0
+            self.__energy[slot] = 0.0
+        self.__passed.clear()
+        self.__start = self.__window_start(timestamp)
+        self.__samples = 0
+        return summary
+
+    def __summary(self, end: float) -> dict:
+        values = {}
+        for slot, path in enumerate(self.__paths):
+            if self.__count[slot] == 0:
+                continue
+            aggregate = {
+                "min": self.__minimum[slot],
+                "max": self.__maximum[slot],
+                "mean": round(self.__total[slot] / self.__count[slot], 2),
+            }
+            if self.__has_energy[slot]:
+                aggregate["energy"] = round(self.__energy[slot], 3)
+            parent = values
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = aggregate
+        for path, value in self.__passed.items():
+            parent = values
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = value
+        return {
+            "start": datetime.fromtimestamp(self.__start, timezone.utc).isoformat(),
+            "end": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+            "window": self.window,
+            "samples": self.__samples,
+            "values": values,
+        }
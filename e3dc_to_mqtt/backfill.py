@@ -0,0 +1,247 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from .metrics import REGISTRY
+from .rscp_worker import RscpTimeoutError
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+BACKFILL_PERIODS = REGISTRY.counter("e3dc_backfill_periods_total", "Periods handled by backfill jobs by result: exported, skipped (already exported) or failed", ["result"])
+
+TIMESPANS = ["day", "month", "year"]
+PERIOD_FORMATS = {"day": "%Y/%m/%d", "month": "%Y/%m", "year": "%Y"}
+PERIOD_STEPS = {"day": relativedelta(days=1), "month": relativedelta(months=1), "year": relativedelta(years=1)}
+
+
+def period_start(timespan: str, day: date) -> date:
+    if timespan == "year":
+        return day.replace(month=1, day=1)
+    if timespan == "month":
+        return day.replace(day=1)
+    return day
+
+
+def last_closed_period(timespan: str, today: date = None) -> date:
+    """Start of the latest period which is over, its DB summary does not change anymore"""
+    today = date.today() if today is None else today
+    return period_start(timespan, today) - PERIOD_STEPS[timespan]
+
+
+class BackfillCheckpoint:
+    """Remembers the periods which were exported already, per destination and timespan.
+
+    A destination is "mqtt" or the absolute path of an output file, so a period exported to
+    one of them is still exported to another. The file is replaced atomically, so an
+    interrupted run never leaves a broken checkpoint.
+    """
+
+    def __init__(self, path: str, save_every: int = 10) -> None:
+        self.path = path
+        self.save_every = save_every
+        self.__done = {}  # type: dict[str, dict[str, set]]
+        self.__unsaved = 0
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    content = json.load(f)
+                if any(not isinstance(timespans, dict) for timespans in content.values()):
+                    LOGGER.warning(f"backfill checkpoint {path} does not record destinations, starting from scratch")
+                else:
+                    self.__done = {destination: {timespan: set(keys) for timespan, keys in timespans.items()} for destination, timespans in content.items()}
+            except (OSError, ValueError) as e:
+                LOGGER.error(f"failed to read backfill checkpoint {path}, starting from scratch: {e}")
+
+    def is_done(self, destination: str, timespan: str, key: str) -> bool:
+        return key in self.__done.get(destination, {}).get(timespan, ())
+
+    def mark_done(self, destination: str, timespan: str, key: str):
+        self.__done.setdefault(destination, {}).setdefault(timespan, set()).add(key)
+        self.__unsaved += 1
+        if self.__unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        if self.path is None or self.__unsaved == 0:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({destination: {timespan: sorted(keys) for timespan, keys in timespans.items()} for destination, timespans in self.__done.items()}, f)
+        os.replace(temp_path, self.path)
+        self.__unsaved = 0
+
+
+class MqttSink:
+    destination = "mqtt"
+
+    def __init__(self, publish) -> None:
+        self.publish = publish
+
+    def write(self, record: dict):
+        self.publish(f"db/data/{record['date']}", record)
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    def __init__(self, path: str, serializer=None) -> None:
+        self.path = path
+        self.destination = os.path.abspath(path)
+        self.serializer = serializer
+        self.__file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        line = self.serializer.dumps(record) if self.serializer is not None else json.dumps(record, separators=(",", ":"))
+        self.__file.write((line.decode("utf-8") if isinstance(line, bytes) else line) + "\n")
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+class CsvSink:
+    """One row per period, the columns are taken from the header of an existing file or the first record."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.destination = os.path.abspath(path)
+        self.__fields = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline="", encoding="utf-8") as f:
+                self.__fields = next(csv.reader(f), None)
+        self.__file = open(path, "a", newline="", encoding="utf-8")
+        self.__writer = None  # type: csv.DictWriter
+
+    def write(self, record: dict):
+        if self.__writer is None:
+            write_header = self.__fields is None
+            if write_header:
+                self.__fields = ["date"] + [key for key in record.keys() if key != "date"]
+            self.__writer = csv.DictWriter(self.__file, self.__fields, extrasaction="ignore")
+            if write_header:
+                self.__writer.writeheader()
+        self.__writer.writerow(record)
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+def open_file_sink(path: str, format: str = None, serializer=None):
+    """format csv or jsonl, default is taken from the file extension"""
+    if format is None:
+        format = "csv" if path.lower().endswith(".csv") else "jsonl"
+    if format == "csv":
+        return CsvSink(path)
+    return JsonLinesSink(path, serializer)
+
+
+class BackfillJob:
+    """Requests the DB summary of every closed period from start to end and writes it to all sinks.
+
+    Requests are spaced to at most rate per second. Periods listed in the checkpoint for every
+    sink are skipped, the others are written to the sinks which do not have them yet and added
+    to the checkpoint for those.
+    """
+
+    def __init__(self, fetch, timespan: str, start: date, end: date, rate: float, sinks: list, checkpoint: BackfillCheckpoint, on_progress=None) -> None:
+        self.fetch = fetch
+        self.timespan = timespan
+        self.start = period_start(timespan, start)
+        self.end = min(period_start(timespan, end), last_closed_period(timespan))
+        self.rate = rate
+        self.sinks = sinks
+        self.checkpoint = checkpoint
+        self.on_progress = on_progress
+        self.state = "pending"
+        self.total = len(self.periods())
+        self.exported = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def periods(self) -> list:
+        periods = []
+        current = self.start
+        while current <= self.end:
+            periods.append(current)
+            current += PERIOD_STEPS[self.timespan]
+        return periods
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "timespan": self.timespan,
+            "from": self.start.isoformat(),
+            "to": self.end.isoformat(),
+            "total": self.total,
+            "exported": self.exported,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        interval = 1.0 / self.rate
+        next_request = loop.time()
+        self.state = "running"
+        LOGGER.info(f"backfill of {self.total} {self.timespan}(s) from {self.start} to {self.end} started")
+        try:
+            for period in self.periods():
+                key = period.strftime(PERIOD_FORMATS[self.timespan])
+                sinks = [sink for sink in self.sinks if not self.checkpoint.is_done(sink.destination, self.timespan, key)]
+                if len(sinks) == 0:
+                    self.skipped += 1
+                    BACKFILL_PERIODS.labels("skipped").inc()
+                    continue
+
+                delay = next_request - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_request = max(next_request, loop.time()) + interval
+
+                if await self.__export(period, key, sinks):
+                    self.exported += 1
+                    BACKFILL_PERIODS.labels("exported").inc()
+                else:
+                    self.failed += 1
+                    BACKFILL_PERIODS.labels("failed").inc()
+                self.__progress()
+            self.state = "done"
+        except asyncio.CancelledError:
+            self.state = "stopped"
+            raise
+        except Exception:
+            self.state = "failed"
+            raise
+        finally:
+            self.checkpoint.save()
+            LOGGER.info(f"backfill {self.state}: {self.exported} exported, {self.skipped} skipped, {self.failed} failed")
+            self.__progress()
+
+    async def __export(self, period: date, key: str, sinks: list) -> bool:
+        try:
+            data = await self.fetch(period)
+        except RscpTimeoutError as e:
+            LOGGER.error(f"backfill of {key} timed out: {e}")
+            return False
+        except Exception as e:
+            LOGGER.error(f"backfill of {key} failed: {e}")
+            return False
+        if data is None:
+            LOGGER.warning(f"no DB data available for {key}")
+            return False
+
+        for sink in sinks:
+            sink.write(data)
+            self.checkpoint.mark_done(sink.destination, self.timespan, key)
+        return True
+
+    def __progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self)
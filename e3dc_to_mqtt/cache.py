@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from .metrics import REGISTRY
+
+DB_CACHE_REQUESTS = REGISTRY.counter("e3dc_db_cache_requests_total", "DB summary requests by result: hit (cached), shared (joined an in-flight fetch) or miss", ["result"])
+
+
+class TtlCache:
+    """Small key/value cache whose entries expire after a fixed time to live."""
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.__entries = {}
+
+    def get(self, key, default=None):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return default
+        value, expires = entry
+        if time.monotonic() >= expires:
+            del self.__entries[key]
+            return default
+        return value
+
+    def set(self, key, value):
+        self.__entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.__entries.clear()
+        else:
+            self.__entries.pop(key, None)
+
+
+class DbDataCache:
+    """LRU cache for DB summaries which also shares in-flight fetches between identical requests.
+
+    Summaries of closed periods never change and are kept until evicted, the summary of the
+    current period is kept for current_ttl seconds only and is not served anymore once the
+    period has closed, so the first request after the rollover fetches the final summary.
+    """
+
+    def __init__(self, max_entries: int = 256, current_ttl: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.current_ttl = current_ttl
+        self.__entries = OrderedDict()
+        self.__in_flight = {}
+
+    async def get(self, key, closed: bool, fetch):
+        entry = self.__entries.get(key)
+        if entry is not None:
+            value, expires, was_closed = entry
+            if was_closed or (not closed and time.monotonic() < expires):
+                self.__entries.move_to_end(key)
+                DB_CACHE_REQUESTS.labels("hit").inc()
+                return value
+            del self.__entries[key]
+
+        task = self.__in_flight.get(key)
+        if task is None:
+            DB_CACHE_REQUESTS.labels("miss").inc()
+            task = asyncio.ensure_future(fetch())
+            self.__in_flight[key] = task
+            task.add_done_callback(lambda t: self.__fetched(key, closed, t))
+        else:
+            DB_CACHE_REQUESTS.labels("shared").inc()
+        # a cancelled requester must not cancel the fetch other requesters are waiting for
+        return await asyncio.shield(task)
+
+    def invalidate(self):
+        self.__entries.clear()
+
+    def __fetched(self, key, closed: bool, task: asyncio.Future):
+        self.__in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.__entries[key] = (task.result(), None if closed else time.monotonic() + self.current_ttl, closed)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
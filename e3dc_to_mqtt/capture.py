@@ -0,0 +1,175 @@
+import json
+import logging
+import threading
+import time
+
+from e3dc._e3dc import AuthenticationError, NotAvailableError, SendError
+
+from .serializer import json_default
+from .topology import Topology
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+CAPTURE_VERSION = 1
+
+# exceptions which are raised again on replay, others are replayed as SendError
+ERRORS = {error.__name__: error for error in [NotAvailableError, SendError, AuthenticationError]}
+
+
+def _default(o):
+    if isinstance(o, (bytes, bytearray)):
+        return o.hex()
+    return json_default(o)
+
+
+def call_key(method: str, args: tuple, kwargs: dict) -> str:
+    """Identifies a call by method and arguments, tuples and lists are the same"""
+    return json.dumps([method, args, kwargs], default=_default, sort_keys=True, separators=(",", ":"))
+
+
+class CaptureWriter:
+    """Appends one JSON line per call to the E3/DC device to a capture file.
+
+    A line holds the start time (t), the latency in seconds (d), the method (m), its positional (a)
+    and keyword (k) arguments and either the result (r) or the exception (e) as [type, message].
+    The topology of the device is written as a line of its own (topology) when it is known, so
+    a replay polls the same power meters, batteries and PV inverters. Every line is flushed, so
+    the capture survives a crash.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__file = open(path, "a", encoding="utf-8")
+        self.__write({"capture": CAPTURE_VERSION, "t": time.time()})
+
+    def record(self, start: float, duration: float, method: str, args: tuple, kwargs: dict, result=None, error: Exception = None):
+        entry = {"t": round(start, 3), "d": round(duration, 4), "m": method, "a": args, "k": kwargs}
+        if error is not None:
+            entry["e"] = [type(error).__name__, str(error)]
+        else:
+            entry["r"] = result
+        try:
+            self.__write(entry)
+        except (TypeError, ValueError) as e:
+            LOGGER.warning(f"call {method} not recorded: {e}")
+
+    def record_topology(self, topology):
+        self.__write({"t": round(time.time(), 3), "topology": topology.to_dict()})
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+    def __write(self, entry: dict):
+        line = json.dumps(entry, default=_default, separators=(",", ":"))
+        with self.__lock:
+            self.__file.write(line + "\n")
+            self.__file.flush()
+
+
+class RecordingE3DC:
+    """Passes every method call to the wrapped E3DC object and records it with a CaptureWriter.
+
+    Attributes set on the wrapper, like sendRequest by batched polls, are set on the wrapped object,
+    so calls between its own methods see them as well.
+    """
+
+    def __init__(self, e3dc, writer: CaptureWriter) -> None:
+        object.__setattr__(self, "_RecordingE3DC__e3dc", e3dc)
+        object.__setattr__(self, "_RecordingE3DC__writer", writer)
+
+    @staticmethod
+    def factory(e3dc_factory, writer: CaptureWriter):
+        """Returns a callable with the signature of the E3DC constructor, to be passed as e3dc_factory"""
+
+        def create(connectType, **kwargs):
+            recording = RecordingE3DC(e3dc_factory(connectType, **kwargs), writer)
+            # the constructor read the static system info unrecorded, read it again so that
+            # refreshes of the system info can be replayed
+            recording.get_system_info_static()
+            return recording
+
+        return create
+
+    def __getattr__(self, name: str):
+        value = getattr(self.__e3dc, name)
+        if name.startswith("_") or not callable(value):
+            return value
+        return lambda *args, **kwargs: self.__record(name, value, args, kwargs)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.__e3dc, name, value)
+
+    def __delattr__(self, name: str):
+        delattr(self.__e3dc, name)
+
+    def __record(self, name: str, method, args: tuple, kwargs: dict):
+        start = time.time()
+        began = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            self.__writer.record(start, time.perf_counter() - began, name, args, kwargs, error=e)
+            raise
+        self.__writer.record(start, time.perf_counter() - began, name, args, kwargs, result)
+        return result
+
+
+class ReplayE3DC:
+    """Stands in for the E3DC object and answers calls from a capture file instead of a device.
+
+    A call gets the recorded results of the same method with the same arguments one after
+    another, starting over after the last one. Calls which were never recorded raise
+    NotAvailableError. Every answer takes the recorded latency divided by speed, speed 0 answers
+    immediately.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0) -> None:
+        self.speed = speed
+        self.__entries = {}  # type: dict[str, list]
+        self.__positions = {}  # type: dict[str, int]
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if "m" in entry:
+                    self.__entries.setdefault(call_key(entry["m"], entry["a"], entry["k"]), []).append(entry)
+        LOGGER.info(f"replaying {sum(len(entries) for entries in self.__entries.values())} calls from {path}")
+
+    @staticmethod
+    def factory(path: str, speed: float = 1.0):
+        """Returns a callable with the signature of the E3DC constructor, to be passed as e3dc_factory"""
+        return lambda connectType, **kwargs: ReplayE3DC(path, speed)
+
+    @staticmethod
+    def recorded_topology(path: str) -> Topology:
+        """Returns the last topology written to a capture file, None if the capture has none"""
+        topology = None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if "topology" in entry:
+                    data = entry["topology"]
+                    topology = Topology(data.get("powermeters"), data.get("batteries"), data.get("pvis"))
+        return topology
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.__replay(name, list(args), kwargs)
+
+    def __replay(self, name: str, args: list, kwargs: dict):
+        key = call_key(name, args, kwargs)
+        entries = self.__entries.get(key)
+        if not entries:
+            raise NotAvailableError(f"{name} not recorded with these arguments")
+        position = self.__positions.get(key, 0)
+        self.__positions[key] = (position + 1) % len(entries)
+        entry = entries[position]
+
+        if self.speed > 0:
+            time.sleep(entry["d"] / self.speed)
+        if "e" in entry:
+            error_type, message = entry["e"]
+            raise ERRORS.get(error_type, SendError)(message)
+        return entry["r"]
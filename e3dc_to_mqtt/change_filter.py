@@ -0,0 +1,75 @@
+import time
+
+from paho.mqtt.client import topic_matches_sub
+
+
+class Deadband:
+    def __init__(self, absolute: float = None, relative: float = None) -> None:
+        self.absolute = absolute
+        self.relative = relative
+
+    @staticmethod
+    def from_config(config: dict) -> "Deadband":
+        return Deadband(config.get("absolute"), config.get("relative"))
+
+    def exceeded(self, old, new) -> bool:
+        if isinstance(old, bool) or isinstance(new, bool) or not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            return old != new
+        delta = abs(new - old)
+        if self.absolute is None and self.relative is None:
+            return delta != 0
+        if self.absolute is not None and delta > self.absolute:
+            return True
+        if self.relative is not None and delta > self.relative * abs(old):
+            return True
+        return False
+
+
+class ChangeFilter:
+    """Decides whether a payload differs enough from the last published one on the same topic.
+
+    Deadbands are looked up by field topic, which is the publish topic plus the path of the field
+    inside the payload, e.g. "live/production/solar". MQTT wildcards are allowed, e.g.
+    "battery_data/+/rsoc". Fields without a matching deadband are published on any change.
+    A topic is always republished once max_silence seconds have passed since its last publish.
+    """
+
+    def __init__(self, deadbands: dict = None, max_silence: float = 60.0) -> None:
+        self.deadbands = [(pattern, Deadband.from_config(config)) for pattern, config in (deadbands or {}).items()]
+        self.max_silence = max_silence
+        self.__last_published = {}
+        self.__deadband_by_field = {}
+
+    def should_publish(self, topic: str, payload) -> bool:
+        now = time.monotonic()
+        last = self.__last_published.get(topic)
+        if last is not None:
+            last_payload, last_time = last
+            if now - last_time < self.max_silence and not self.__changed(topic, last_payload, payload):
+                return False
+        self.__last_published[topic] = (payload, now)
+        return True
+
+    def forget(self, topic: str = None):
+        if topic is None:
+            self.__last_published.clear()
+        else:
+            self.__last_published.pop(topic, None)
+
+    def __changed(self, field: str, old, new) -> bool:
+        if isinstance(old, dict) and isinstance(new, dict):
+            if old.keys() != new.keys():
+                return True
+            return any(self.__changed(f"{field}/{key}", old[key], new[key]) for key in new)
+        if isinstance(old, list) and isinstance(new, list):
+            if len(old) != len(new):
+                return True
+            return any(self.__changed(f"{field}/{idx}", old_value, new_value) for idx, (old_value, new_value) in enumerate(zip(old, new)))
+        return self.__get_deadband(field).exceeded(old, new)
+
+    def __get_deadband(self, field: str) -> Deadband:
+        deadband = self.__deadband_by_field.get(field)
+        if deadband is None:
+            deadband = next((deadband for pattern, deadband in self.deadbands if topic_matches_sub(pattern, field)), Deadband())
+            self.__deadband_by_field[field] = deadband
+        return deadband
@@ -7,4 +7,4 @@ class DateTimeEncoder(json.JSONEncoder):
         if isinstance(o, date):
             return o.isoformat()
 
-        return super().default(self, o)
+        return super().default(o)
@@ -1,4 +1,6 @@
 import argparse
+import functools
+import os
 import logging
 import asyncio
 import json
@@ -11,10 +13,28 @@ from datetime import timedelta, date
 from concurrent.futures._base import CancelledError
 
 from e3dc import E3DC
-from e3dc._e3dc import NotAvailableError
+from e3dc._e3dc import NotAvailableError, SendError, AuthenticationError
 
 from .__version import __version__
-from .__mqtt import MqttClient
+from .__mqtt import MqttClient, MqttScope
+from .rscp_worker import RscpWorker
+from .scheduler import PollScheduler, PollCategory
+from .cache import TtlCache, DbDataCache
+from .change_filter import ChangeFilter
+from .flat_topics import FlatTopics
+from .store_forward import StoreAndForward, MemoryBuffer, FileBuffer
+from .metrics import REGISTRY, MetricsServer
+from .serializer import CODECS, get_serializer, orjson
+from .trace import LazyJson, PayloadTracer
+from .request_response import RequestHandler, MqttRequest, RequestError
+from .topology import Topology
+from .pvi import build_pvi_request, parse_pvi_response
+from .rscp_batch import BatchedPoll
+from .aggregation import WindowAggregator, ENERGY_PREFIXES, MEASUREMENT_PREFIXES
+from .history import HistoryBuffer
+from .adaptive import AdaptiveInterval
+from .capture import CaptureWriter, RecordingE3DC, ReplayE3DC
+from .backfill import BackfillJob, BackfillCheckpoint, MqttSink, TIMESPANS, open_file_sink
 from .dateTimeEncoder import DateTimeEncoder
 
 LOGGER = logging.getLogger("e3dc-to-mqtt")
@@ -25,8 +45,112 @@ DEFAULT_ARGS = {
     "mqttport": 1883,
     "mqttkeepalive": 60,
     "mqttbasetopic": "e3dc/",
+    "e3dctimeout": 10.0,
+    "systeminfottl": 3600.0,
+    "publishmode": "all",
+    "publishmaxsilence": 60.0,
+    "outputmode": "json",
+    "buffer": "none",
+    "bufferfile": "e3dc-to-mqtt.buffer",
+    "buffersize": 100000,
+    "bufferdroppolicy": "oldest",
+    "bufferreplayrate": 50.0,
+    "publishqueuesize": 1000,
+    "publishqueuebytes": 1024 * 1024,
+    "publishflushinterval": 0.1,
+    "metricshost": "127.0.0.1",
+    "metricsmqttinterval": 0.0,
+    "serializer": "auto",
+    "tracesamplerate": 1.0,
+    "tracemaxpersecond": 1.0,
+    "tracemaxbytes": 10 * 1024 * 1024,
+    "dbcachesize": 256,
+    "dbcachettl": 300.0,
+    "requestconcurrency": 2,
+    "requestmaxpending": 32,
+    "requesttimeout": 30.0,
+    "backfillrate": 1.0,
+    "backfillcheckpoint": "e3dc-to-mqtt.backfill.json",
+    "topologyfile": "e3dc-to-mqtt.topology.json",
+    "batchrequests": False,
+    "aggregateonly": False,
+    "historyduration": 0.0,
+    "historyresolution": 1.0,
+    "adaptivepolling": False,
+    "adaptiveintervalmin": 1.0,
+    "adaptiveintervalmax": 30.0,
+    "adaptivethreshold": 100.0,
+    "replayspeed": 1.0,
 }
 
+# settings which can be given per device in the devices list of the config file
+DEVICE_ARGS = [
+    "e3dchost",
+    "e3dcusername",
+    "e3dcpassword",
+    "e3dcrscpkey",
+    "e3dctimeout",
+    "systeminfottl",
+    "dbcachesize",
+    "dbcachettl",
+    "mqttbasetopic",
+    "interval",
+    "polling",
+    "publishmode",
+    "publishmaxsilence",
+    "publishing",
+    "deadbands",
+    "outputmode",
+    "buffer",
+    "bufferfile",
+    "buffersize",
+    "bufferdroppolicy",
+    "bufferreplayrate",
+    "backfillrate",
+    "backfillcheckpoint",
+    "topologyfile",
+    "batchrequests",
+    "aggregatewindows",
+    "aggregateonly",
+    "historyduration",
+    "historyresolution",
+    "adaptivepolling",
+    "adaptiveintervalmin",
+    "adaptiveintervalmax",
+    "adaptivethreshold",
+    "recordfile",
+    "replayfile",
+    "replayspeed",
+]
+
+# power meter indices in the order they are probed, 0 is most common, 6 is used by S10 mini
+POWERMETER_INDICES = [0, 6, 1, 2, 3, 4, 5]
+MAX_BATTERIES = 8
+MAX_PVIS = 4
+
+# backfill requests queue behind every polled category
+BACKFILL_PRIORITY = 10
+
+# interval None means the general --interval is used, lower priority values are requested from the device first
+DEFAULT_POLLING = {
+    "live": {"interval": None, "priority": 0},
+    "power_data": {"interval": None, "priority": 1},
+    "battery_data": {"interval": None, "priority": 2},
+    "pvi_data": {"interval": None, "priority": 2},
+    "db_data": {"interval": 60.0, "priority": 5},
+    "topology": {"interval": 3600.0, "priority": 9},
+    "system_info": {"interval": 300.0, "priority": 9},
+}
+
+# categories which can be requested from the device with combined RSCP frames, see --batch-requests
+BATCHED_CATEGORIES = ["live", "power_data", "battery_data", "pvi_data"]
+
+# first part of the topics whose QoS and retain flag can be set, see --publish-qos
+PUBLISH_CATEGORIES = ["system_info", "live", "power_data", "battery_data", "pvi_data", "db", "backfill"]
+
+# categories kept in memory for history/get/... requests, see --history-duration
+HISTORY_CATEGORIES = ["live", "power_data"]
+
 
 def main():
     try:
@@ -45,23 +169,145 @@ class DbTimespan(Enum):
 
 
 class E3DC2MQTT:
-    def __init__(self) -> None:
-        e3dc = None  # type: E3DCClient
-        mqtt = None  # type: MqttClient
-        loop = None  # type: asyncio.AbstractEventLoop
+    def __init__(self, e3dc_factory=None, mqtt_client=None) -> None:
+        self.e3dc_factory = e3dc_factory
+        self.mqtt_client = mqtt_client
+        self.e3dc = None  # type: E3DCClient
+        self.mqtt = None  # type: MqttClient
+        self.loop = None  # type: asyncio.AbstractEventLoop
+        self.scheduler = None  # type: PollScheduler
+        self.change_filter = None  # type: ChangeFilter
+        self.flat_topics = None  # type: FlatTopics
+        self.publish_json = True
+        self.publishing = {}  # type: dict[str, dict]
+        self.codecs = {}  # type: dict[str, object]
+        self.store_forward = None  # type: StoreAndForward
+        self.metrics_server = None  # type: MetricsServer
+        self.tracer = None  # type: PayloadTracer
+        self.requests = None  # type: RequestHandler
+        self.backfill_task = None  # type: asyncio.Task
+        self.args = None
+        self.name = None
+        self.parent = None  # type: E3DC2MQTT
+        self.devices = []  # type: list[E3DC2MQTT]
+        self.aggregators = {}  # type: dict[str, list[WindowAggregator]]
+        self.aggregate_only = False
+        self.history = {}  # type: dict[str, HistoryBuffer]
+        self.adaptive = None  # type: AdaptiveInterval
+        self.adaptive_categories = []  # type: list[PollCategory]
+        self.capture = None  # type: CaptureWriter
+        self.__published_system_info = None
+        self.__polls_skipped = False
 
     def __add_from_config(self, cmdArgs: dict, config: dict, name: str):
         if name in config:
             setattr(cmdArgs, name, config[name])
 
-    async def run(self, loop: asyncio.AbstractEventLoop):
+    async def run(self, loop: asyncio.AbstractEventLoop, argv: list = None):
         self.loop = loop
+        args = self.parse_args(argv)
+        if args is None:
+            return
+
+        try:
+            if args.command == "backfill":
+                await self.backfill(args)
+            else:
+                await self.start(args)
+                await asyncio.gather(self.scheduler.run(), *(device.scheduler.run() for device in self.devices))
+        except KeyboardInterrupt:
+            pass  # do nothing, close requested
+        except CancelledError:
+            pass  # do nothing, close requested
+        except Exception as e:
+            LOGGER.exception(f"exception in main loop")
+        finally:
+            LOGGER.info(f"shutdown requested")
+            await self.stop()
+
+    def parse_args(self, argv: list = None):
         parser = argparse.ArgumentParser(prog="e3dc-to-mqtt", description="Commandline Interface to interact with E3/DC devices")
         parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
         parser.add_argument("--releaseName", type=str, dest="releaseName", help="Name of the current release")
         parser.add_argument("--configFile", type=str, dest="configFile", help="File where config is stored (JSON)")
         parser.add_argument("--loglevel", type=str, dest="loglevel", help='Minimum log level, DEBUG/INFO/WARNING/ERROR/CRITICAL"', default=DEFAULT_ARGS["loglevel"])
         parser.add_argument("--interval", type=float, dest="interval", help="Interval in seconds in which E3/DC data is requested. Minimum: 1.0", default=DEFAULT_ARGS["interval"])
+        parser.add_argument("--poll-interval", type=str, dest="pollinterval", action="append", help="Interval of one data category as CATEGORY=SECONDS, e.g. system_info=300")
+
+        parser.add_argument(
+            "--publish-mode", type=str, dest="publishmode", choices=["all", "changes"], help="Publish every poll (all) or only values which changed (changes)", default=DEFAULT_ARGS["publishmode"]
+        )
+        parser.add_argument(
+            "--publish-max-silence",
+            type=float,
+            dest="publishmaxsilence",
+            help="In publish mode changes, time in seconds after which a topic is published even if unchanged",
+            default=DEFAULT_ARGS["publishmaxsilence"],
+        )
+        parser.add_argument("--publish-qos", type=str, dest="publishqos", action="append", help="QoS of the topics of one category as CATEGORY=QOS, e.g. live=1")
+        parser.add_argument("--publish-retain", type=str, dest="publishretain", action="append", help="Retain flag of the topics of one category as CATEGORY=true|false, e.g. live=true")
+        parser.add_argument(
+            "--publish-codec", type=str, dest="publishcodec", action="append", help=f"Payload codec of the topics of one category as CATEGORY=CODEC ({', '.join(CODECS)}), e.g. live=msgpack"
+        )
+        parser.add_argument(
+            "--publish-queue-size", type=int, dest="publishqueuesize", help="Maximum number of messages waiting to be sent to the MQTT broker", default=DEFAULT_ARGS["publishqueuesize"]
+        )
+        parser.add_argument(
+            "--publish-queue-bytes",
+            type=int,
+            dest="publishqueuebytes",
+            help="Maximum payload bytes of the messages waiting to be sent to the MQTT broker",
+            default=DEFAULT_ARGS["publishqueuebytes"],
+        )
+        parser.add_argument(
+            "--publish-flush-interval",
+            type=float,
+            dest="publishflushinterval",
+            help="Time in seconds messages are collected before they are sent to the MQTT broker together",
+            default=DEFAULT_ARGS["publishflushinterval"],
+        )
+        parser.add_argument(
+            "--output-mode",
+            type=str,
+            dest="outputmode",
+            choices=["json", "flat", "both"],
+            help="Publish one JSON document per category (json), one topic per value (flat) or both",
+            default=DEFAULT_ARGS["outputmode"],
+        )
+        parser.add_argument(
+            "--buffer", type=str, dest="buffer", choices=["none", "memory", "file"], help="Where to keep samples while the MQTT broker is not reachable", default=DEFAULT_ARGS["buffer"]
+        )
+        parser.add_argument("--buffer-file", type=str, dest="bufferfile", help="File used by --buffer file", default=DEFAULT_ARGS["bufferfile"])
+        parser.add_argument("--buffer-size", type=int, dest="buffersize", help="Maximum number of buffered samples", default=DEFAULT_ARGS["buffersize"])
+        parser.add_argument(
+            "--buffer-drop-policy", type=str, dest="bufferdroppolicy", choices=["oldest", "newest"], help="Which samples to drop when the buffer is full", default=DEFAULT_ARGS["bufferdroppolicy"]
+        )
+        parser.add_argument("--buffer-replay-rate", type=float, dest="bufferreplayrate", help="Buffered samples published per second after reconnect", default=DEFAULT_ARGS["bufferreplayrate"])
+        parser.add_argument("--metrics-port", type=int, dest="metricsport", help="Port of the HTTP endpoint serving metrics in Prometheus format. Disabled if not set")
+        parser.add_argument("--metrics-host", type=str, dest="metricshost", help="Address the metrics endpoint listens on", default=DEFAULT_ARGS["metricshost"])
+        parser.add_argument(
+            "--metrics-mqtt-interval",
+            type=float,
+            dest="metricsmqttinterval",
+            help="Interval in seconds in which metrics are published to $SYS/metrics. 0 to disable",
+            default=DEFAULT_ARGS["metricsmqttinterval"],
+        )
+        parser.add_argument(
+            "--serializer", type=str, dest="serializer", choices=["auto", "json", "orjson"], help="JSON encoder for payloads, auto uses orjson if installed", default=DEFAULT_ARGS["serializer"]
+        )
+        parser.add_argument("--trace-file", type=str, dest="tracefile", help="File to write a sample of the received payloads to, as JSON lines. Disabled if not set")
+        parser.add_argument("--trace-sample-rate", type=float, dest="tracesamplerate", help="Fraction of received payloads written to the trace file", default=DEFAULT_ARGS["tracesamplerate"])
+        parser.add_argument(
+            "--trace-max-per-second", type=float, dest="tracemaxpersecond", help="Maximum number of payloads written to the trace file per second", default=DEFAULT_ARGS["tracemaxpersecond"]
+        )
+        parser.add_argument("--trace-max-bytes", type=int, dest="tracemaxbytes", help="Size in bytes at which the trace file is rotated", default=DEFAULT_ARGS["tracemaxbytes"])
+        parser.add_argument("--request-concurrency", type=int, dest="requestconcurrency", help="MQTT v5 requests (db/get/...) processed at the same time", default=DEFAULT_ARGS["requestconcurrency"])
+        parser.add_argument(
+            "--request-max-pending", type=int, dest="requestmaxpending", help="MQTT v5 requests waiting or processed before new ones are rejected", default=DEFAULT_ARGS["requestmaxpending"]
+        )
+        parser.add_argument(
+            "--request-timeout", type=float, dest="requesttimeout", help="Time in seconds after which an MQTT v5 request is answered with a timeout error", default=DEFAULT_ARGS["requesttimeout"]
+        )
 
         parser.add_argument("--mqtt-broker", type=str, dest="mqttbroker", help="Address of MQTT Broker to connect to")
         parser.add_argument("--mqtt-port", type=int, dest="mqttport", help="Port of MQTT Broker. Default is 1883 (8883 for TLS)", default=DEFAULT_ARGS["mqttport"])
@@ -75,14 +321,108 @@ class E3DC2MQTT:
         parser.add_argument("--e3dc-username", type=str, dest="e3dcusername", help="Username for login on E3/DC device")
         parser.add_argument("--e3dc-password", type=str, dest="e3dcpassword", help="Password for login on E3/DC device")
         parser.add_argument("--e3dc-rscpkey", type=str, dest="e3dcrscpkey", help="RSCP key for login on E3/DC device. Must be set on device.")
+        parser.add_argument(
+            "--system-info-ttl", type=float, dest="systeminfottl", help="Time in seconds static system info is cached before it is requested again", default=DEFAULT_ARGS["systeminfottl"]
+        )
+        parser.add_argument("--db-cache-size", type=int, dest="dbcachesize", help="Number of DB summaries kept in memory", default=DEFAULT_ARGS["dbcachesize"])
+        parser.add_argument("--db-cache-ttl", type=float, dest="dbcachettl", help="Time in seconds the DB summary of a running day/month/year is cached", default=DEFAULT_ARGS["dbcachettl"])
+        parser.add_argument("--e3dc-timeout", type=float, dest="e3dctimeout", help="Timeout in seconds for a single request to the E3/DC device", default=DEFAULT_ARGS["e3dctimeout"])
+        parser.add_argument(
+            "--topology-file", type=str, dest="topologyfile", help="File in which the discovered power meter, batteries and PV inverters are stored", default=DEFAULT_ARGS["topologyfile"]
+        )
+        parser.add_argument(
+            "--batch-requests",
+            action="store_true",
+            dest="batchrequests",
+            help="Request live, power meter, battery and PVI data polled on the same interval with one combined RSCP frame per poll",
+            default=DEFAULT_ARGS["batchrequests"],
+        )
+        parser.add_argument(
+            "--aggregate-window",
+            type=float,
+            dest="aggregatewindows",
+            action="append",
+            help="Length in seconds of windows over which live and power meter values are aggregated (min, max, mean, energy), can be given several times",
+        )
+        parser.add_argument(
+            "--aggregate-only", action="store_true", dest="aggregateonly", help="Publish only the aggregates of live and power meter data, not every sample", default=DEFAULT_ARGS["aggregateonly"]
+        )
+        parser.add_argument(
+            "--history-duration",
+            type=float,
+            dest="historyduration",
+            help="Seconds of live and power meter samples kept in memory for history/get/... requests. 0 to disable",
+            default=DEFAULT_ARGS["historyduration"],
+        )
+        parser.add_argument("--history-resolution", type=float, dest="historyresolution", help="Time in seconds between samples kept in the history", default=DEFAULT_ARGS["historyresolution"])
+        parser.add_argument(
+            "--adaptive-polling",
+            action="store_true",
+            dest="adaptivepolling",
+            help="Shorten the interval of live data and the categories polled with it when power values change quickly, stretch it when they are flat",
+            default=DEFAULT_ARGS["adaptivepolling"],
+        )
+        parser.add_argument("--adaptive-interval-min", type=float, dest="adaptiveintervalmin", help="Shortest interval of adaptive polling in seconds", default=DEFAULT_ARGS["adaptiveintervalmin"])
+        parser.add_argument("--adaptive-interval-max", type=float, dest="adaptiveintervalmax", help="Longest interval of adaptive polling in seconds", default=DEFAULT_ARGS["adaptiveintervalmax"])
+        parser.add_argument(
+            "--adaptive-threshold",
+            type=float,
+            dest="adaptivethreshold",
+            help="Change of a power value in W between two polls from which adaptive polling shortens the interval",
+            default=DEFAULT_ARGS["adaptivethreshold"],
+        )
+        parser.add_argument("--record-file", type=str, dest="recordfile", help="File to which every call to the E3/DC device is appended with its result and latency, for --replay-file")
+        parser.add_argument("--replay-file", type=str, dest="replayfile", help="Answer calls from a file written by --record-file instead of connecting to the E3/DC device")
+        parser.add_argument(
+            "--replay-speed", type=float, dest="replayspeed", help="Speed of replayed answers relative to the recorded latency, 0 answers immediately", default=DEFAULT_ARGS["replayspeed"]
+        )
+        parser.add_argument("--backfill-rate", type=float, dest="backfillrate", help="DB summaries requested per second by backfill jobs", default=DEFAULT_ARGS["backfillrate"])
+        parser.add_argument("--backfill-checkpoint", type=str, dest="backfillcheckpoint", help="File in which backfill jobs record the exported periods", default=DEFAULT_ARGS["backfillcheckpoint"])
+
+        subparsers = parser.add_subparsers(dest="command", metavar="command")
+        backfill = subparsers.add_parser("backfill", help="Export the DB summaries of a date range and exit")
+        backfill.add_argument("--from", type=date.fromisoformat, dest="backfillfrom", required=True, help="First day (YYYY-MM-DD) to export")
+        backfill.add_argument("--to", type=date.fromisoformat, dest="backfillto", help="Last day (YYYY-MM-DD) to export. Default is the last finished period")
+        backfill.add_argument("--device", type=str, dest="backfilldevice", help="Name of the device to export, if several devices are configured")
+        backfill.add_argument("--timespan", type=str, dest="backfilltimespan", choices=TIMESPANS, help="Export one summary per day, month or year", default="day")
+        backfill.add_argument("--output", type=str, dest="backfilloutput", help="File the summaries are appended to")
+        backfill.add_argument("--format", type=str, dest="backfillformat", choices=["csv", "jsonl"], help="Format of the output file, default is taken from its extension")
+        backfill.add_argument("--no-mqtt", action="store_true", dest="backfillnomqtt", help="Do not publish the summaries to db/data/...")
+        backfill.add_argument("--rate", type=float, dest="backfillrate", help="DB summaries requested per second", default=argparse.SUPPRESS)
+        backfill.add_argument("--checkpoint", type=str, dest="backfillcheckpoint", help="File in which the exported periods are recorded", default=argparse.SUPPRESS)
 
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
 
         if args.configFile is not None:
             with open(args.configFile) as f:
                 config = json.load(f)
             self.__add_from_config(args, config, "loglevel")
             self.__add_from_config(args, config, "interval")
+            self.__add_from_config(args, config, "polling")
+            self.__add_from_config(args, config, "publishmode")
+            self.__add_from_config(args, config, "publishmaxsilence")
+            self.__add_from_config(args, config, "publishing")
+            self.__add_from_config(args, config, "publishqueuesize")
+            self.__add_from_config(args, config, "publishqueuebytes")
+            self.__add_from_config(args, config, "publishflushinterval")
+            self.__add_from_config(args, config, "deadbands")
+            self.__add_from_config(args, config, "outputmode")
+            self.__add_from_config(args, config, "buffer")
+            self.__add_from_config(args, config, "bufferfile")
+            self.__add_from_config(args, config, "buffersize")
+            self.__add_from_config(args, config, "bufferdroppolicy")
+            self.__add_from_config(args, config, "bufferreplayrate")
+            self.__add_from_config(args, config, "metricsport")
+            self.__add_from_config(args, config, "metricshost")
+            self.__add_from_config(args, config, "metricsmqttinterval")
+            self.__add_from_config(args, config, "serializer")
+            self.__add_from_config(args, config, "tracefile")
+            self.__add_from_config(args, config, "tracesamplerate")
+            self.__add_from_config(args, config, "tracemaxpersecond")
+            self.__add_from_config(args, config, "tracemaxbytes")
+            self.__add_from_config(args, config, "requestconcurrency")
+            self.__add_from_config(args, config, "requestmaxpending")
+            self.__add_from_config(args, config, "requesttimeout")
 
             self.__add_from_config(args, config, "mqttbroker")
             self.__add_from_config(args, config, "mqttport")
@@ -96,6 +436,26 @@ class E3DC2MQTT:
             self.__add_from_config(args, config, "e3dcusername")
             self.__add_from_config(args, config, "e3dcpassword")
             self.__add_from_config(args, config, "e3dcrscpkey")
+            self.__add_from_config(args, config, "e3dctimeout")
+            self.__add_from_config(args, config, "systeminfottl")
+            self.__add_from_config(args, config, "dbcachesize")
+            self.__add_from_config(args, config, "dbcachettl")
+            self.__add_from_config(args, config, "backfillrate")
+            self.__add_from_config(args, config, "backfillcheckpoint")
+            self.__add_from_config(args, config, "topologyfile")
+            self.__add_from_config(args, config, "batchrequests")
+            self.__add_from_config(args, config, "aggregatewindows")
+            self.__add_from_config(args, config, "aggregateonly")
+            self.__add_from_config(args, config, "historyduration")
+            self.__add_from_config(args, config, "historyresolution")
+            self.__add_from_config(args, config, "adaptivepolling")
+            self.__add_from_config(args, config, "adaptiveintervalmin")
+            self.__add_from_config(args, config, "adaptiveintervalmax")
+            self.__add_from_config(args, config, "adaptivethreshold")
+            self.__add_from_config(args, config, "recordfile")
+            self.__add_from_config(args, config, "replayfile")
+            self.__add_from_config(args, config, "replayspeed")
+            self.__add_from_config(args, config, "devices")
 
         valid_loglevels = ["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]
         if args.loglevel not in valid_loglevels:
@@ -117,267 +477,964 @@ class E3DC2MQTT:
         if args.releaseName is not None:
             LOGGER.debug(f"Release name: {args.releaseName}")
 
-        if args.mqttbroker is None:
+        if args.command == "backfill":
+            if args.backfillnomqtt and args.backfilloutput is None:
+                LOGGER.error(f"backfill with --no-mqtt needs an --output file")
+                return
+        if args.mqttbroker is None and not (args.command == "backfill" and args.backfillnomqtt):
             LOGGER.error(f"no mqtt broker given")
             return
-        if args.e3dchost is None:
-            LOGGER.error(f"no E3DC host given")
+        if int(args.publishqueuesize) < 1 or int(args.publishqueuebytes) < 1 or float(args.publishflushinterval) < 0:
+            LOGGER.error(f"publish queue size and bytes must be >= 1 and publish flush interval >= 0")
             return
-        if args.e3dcusername is None:
-            LOGGER.error(f"no E3DC username given")
+        devices = self.__get_devices_config(args)
+        if devices is None:
             return
-        if args.e3dcpassword is None:
-            LOGGER.error(f"no E3DC password given")
+        if len(devices) == 0 and not self.__check_device_args(args):
             return
-        if args.e3dcrscpkey is None:
-            LOGGER.error(f"no E3DC RSCP key given")
+        if args.command == "backfill" and len(devices) > 0 and args.backfilldevice not in [device.name for device in devices]:
+            LOGGER.error(f"backfill needs --device, one of: {', '.join(device.name for device in devices)}")
             return
-        if float(args.interval) < 1:
-            LOGGER.error(f"interval must be >= 1")
+
+        if args.serializer == "orjson" and orjson is None:
+            LOGGER.error(f"serializer orjson requested, but orjson is not installed")
             return
 
-        try:
-            self.mqtt = MqttClient(LOGGER, self.loop, args.mqttbroker, args.mqttport, args.mqttclientid, args.mqttkeepalive, args.mqttusername, args.mqttpassword, args.mqttbasetopic)
-            await self.mqtt.start()
-            self.mqtt.subscribe_to("/db/get/+", self.__on_mqtt_get_year)
-            self.mqtt.subscribe_to("/db/get/+/+", self.__on_mqtt_get_month)
-            self.mqtt.subscribe_to("/db/get/+/+/+", self.__on_mqtt_get_day)
-            self.e3dc = E3DCClient(args.e3dchost, args.e3dcusername, args.e3dcpassword, args.e3dcrscpkey)
-
-            last_cycle = 0.0
-            while True:
-                await asyncio.sleep(max(0, args.interval - (time.time() - last_cycle)))
-                last_cycle = time.time()
-
-                if not self.mqtt.is_connected:
-                    LOGGER.error(f"mqtt not connected")
+        return args
+
+    def __check_device_args(self, args) -> bool:
+        device = f" for device {args.name}" if getattr(args, "name", None) else ""
+        if args.replayfile is not None:
+            if args.batchrequests:
+                LOGGER.error(f"--replay-file cannot be combined with --batch-requests{device}")
+                return False
+            if float(args.replayspeed) < 0:
+                LOGGER.error(f"replay speed must be >= 0{device}")
+                return False
+        elif args.e3dchost is None:
+            LOGGER.error(f"no E3DC host given{device}")
+            return False
+        elif args.e3dcusername is None:
+            LOGGER.error(f"no E3DC username given{device}")
+            return False
+        elif args.e3dcpassword is None:
+            LOGGER.error(f"no E3DC password given{device}")
+            return False
+        elif args.e3dcrscpkey is None:
+            LOGGER.error(f"no E3DC RSCP key given{device}")
+            return False
+        if float(args.interval) < 1:
+            LOGGER.error(f"interval must be >= 1{device}")
+            return False
+        if float(args.backfillrate) <= 0:
+            LOGGER.error(f"backfill rate must be > 0{device}")
+            return False
+        if int(args.buffersize) < 1 or float(args.bufferreplayrate) <= 0:
+            LOGGER.error(f"buffer size must be >= 1 and buffer replay rate > 0{device}")
+            return False
+
+        if self.__get_polling_config(args) is None:
+            return False
+        if self.__get_publishing_config(args) is None:
+            return False
+
+        if args.outputmode not in ["json", "flat", "both"]:
+            LOGGER.error(f"invalid output mode {args.outputmode}{device}, allowed values: json, flat, both")
+            return False
+        if any(float(window) <= 0 for window in args.aggregatewindows or []):
+            LOGGER.error(f"aggregate windows must be > 0{device}")
+            return False
+        if args.aggregateonly and not args.aggregatewindows:
+            LOGGER.error(f"--aggregate-only needs at least one --aggregate-window{device}")
+            return False
+        if float(args.historyduration) < 0 or float(args.historyresolution) <= 0:
+            LOGGER.error(f"history duration must be >= 0 and history resolution > 0{device}")
+            return False
+        if args.adaptivepolling and not 1 <= float(args.adaptiveintervalmin) <= float(args.adaptiveintervalmax):
+            LOGGER.error(f"adaptive polling needs 1 <= adaptive interval min <= adaptive interval max{device}")
+            return False
+        return True
+
+    def __get_devices_config(self, args) -> list:
+        """One set of args per entry in the devices list of the config file, based on the global args"""
+        devices = []
+        for config in getattr(args, "devices", None) or []:
+            name = config.get("name")
+            if not name or any(c in name for c in "/+#"):
+                LOGGER.error(f"invalid device name {name}, every device needs a name without /, + and #")
+                return None
+            if name in [device.name for device in devices]:
+                LOGGER.error(f"device name {name} is used more than once")
+                return None
+            unknown = [key for key in config if key != "name" and key not in DEVICE_ARGS]
+            if unknown:
+                LOGGER.error(f"unknown settings for device {name}: {', '.join(unknown)}, allowed values: {', '.join(DEVICE_ARGS)}")
+                return None
+
+            device_args = argparse.Namespace(**vars(args))
+            device_args.name = name
+            device_args.devices = None
+            device_args.mqttbasetopic = f"{args.mqttbasetopic}{name}/"
+            for key in ["bufferfile", "backfillcheckpoint", "topologyfile", "recordfile", "replayfile"]:
+                # devices must not share a file
+                if getattr(args, key) is None:
                     continue
+                root, extension = os.path.splitext(getattr(args, key))
+                setattr(device_args, key, f"{root}.{name}{extension}")
+            for key, value in config.items():
+                setattr(device_args, key, value)
 
-                system_info = await self.e3dc.get_system_info()
-                LOGGER.debug(f"received system info:\r\n" + json.dumps(system_info, indent=2))
-                self.mqtt.publish("system_info", system_info)
-
-                power_data = await self.e3dc.get_powermeter_data()
-                LOGGER.debug(f"received powermeter data:\r\n" + json.dumps(power_data, indent=2))
-                self.mqtt.publish(f"power_data", power_data)
-
-                battery_data = await self.e3dc.get_battery_data()
-                LOGGER.debug(f"received battery data:\r\n" + json.dumps(battery_data, indent=2))
-                for idx, bat in enumerate(battery_data):
-                    self.mqtt.publish(f"battery_data/{idx}", bat)
-
-                pvi_data = await self.e3dc.get_pvi_data()
-                LOGGER.debug(f"received pvi data:\r\n" + json.dumps(pvi_data, indent=2))
-                for idx, pvi in enumerate(pvi_data):
-                    self.mqtt.publish(f'pvi_data/{pvi["stringIndex"]}/{idx}', pvi)
-
-                live_data = await self.e3dc.get_live_data()
-                LOGGER.debug(f"received live data:\r\n" + json.dumps(live_data, indent=2))
-                self.mqtt.publish(f"live", live_data)
-
-                db_data_day = await self.e3dc.get_db_data_day()
-                if db_data_day is not None:
-                    LOGGER.debug(f"received db data DAY:\r\n" + json.dumps(db_data_day, indent=2, cls=DateTimeEncoder))
-                    self.mqtt.publish(f"db/data/{db_data_day['date']}", db_data_day)
-                    self.mqtt.publish(f"db/data/daily", db_data_day)
-
-                db_data_month = await self.e3dc.get_db_data_month()
-                if db_data_month is not None:
-                    LOGGER.debug(f"received db data MONTH:\r\n" + json.dumps(db_data_month, indent=2, cls=DateTimeEncoder))
-                    self.mqtt.publish(f"db/data/{db_data_month['date']}", db_data_month)
-        except KeyboardInterrupt:
-            pass  # do nothing, close requested
-        except CancelledError:
-            pass  # do nothing, close requested
-        except Exception as e:
-            LOGGER.exception(f"exception in main loop")
+            if not self.__check_device_args(device_args):
+                return None
+            devices.append(device_args)
+        return devices
+
+    async def start(self, args, parent=None):
+        """Starts polling the device given in args. Without parent, also connects to the MQTT broker
+        and starts the devices configured in args.devices, which share that connection."""
+        self.args = args
+        self.parent = parent
+        if self.loop is None:
+            self.loop = parent.loop if parent is not None else asyncio.get_event_loop()
+
+        if parent is None:
+            if args.tracefile is not None:
+                self.tracer = PayloadTracer(args.tracefile, args.tracesamplerate, args.tracemaxpersecond, args.tracemaxbytes)
+            self.mqtt = self.__create_mqtt_client(args)
+            await self.mqtt.start()
+            self.requests = RequestHandler(self.mqtt, self.loop, args.requestconcurrency, args.requestmaxpending, args.requesttimeout)
+        else:
+            self.name = args.name
+            self.tracer = parent.tracer
+            self.mqtt = parent.mqtt.scope(args.mqttbasetopic)
+            await self.mqtt.start()
+            self.requests = parent.requests
+
+        self.scheduler = PollScheduler(self.name or "")
+        devices = self.__get_devices_config(args) if parent is None else []
+        if len(devices) > 0:
+            for device_args in devices:
+                device = E3DC2MQTT(self.e3dc_factory)
+                await device.start(device_args, self)
+                self.devices.append(device)
+        else:
+            self.__start_device(args)
+
+        if parent is None:
+            if args.metricsmqttinterval > 0:
+                self.scheduler.add("metrics", args.metricsmqttinterval, 0, self.__publish_metrics)
+            if args.metricsport is not None:
+                self.metrics_server = MetricsServer(args.metricshost, args.metricsport)
+                await self.metrics_server.start()
+
+    def __start_device(self, args):
+        polling = self.__get_polling_config(args)
+
+        if args.publishmode == "changes":
+            self.change_filter = ChangeFilter(getattr(args, "deadbands", None), args.publishmaxsilence)
+
+        self.publish_json = args.outputmode != "flat"
+        self.publishing = self.__get_publishing_config(args)
+        # json is encoded by the serializer of the MQTT client
+        self.codecs = {name: get_serializer(settings["codec"]) for name, settings in self.publishing.items() if settings.get("codec", "json") != "json"}
+        if args.outputmode != "json":
+            self.flat_topics = FlatTopics()
+
+        if args.buffer == "memory":
+            self.store_forward = StoreAndForward(MemoryBuffer(args.buffersize, args.bufferdroppolicy), args.bufferreplayrate, self.__publish_options)
+        elif args.buffer == "file":
+            self.store_forward = StoreAndForward(FileBuffer(args.bufferfile, args.buffersize, args.bufferdroppolicy), args.bufferreplayrate, self.__publish_options)
+
+        self.aggregators = {
+            name: [WindowAggregator(float(window), ENERGY_PREFIXES[name], measurement_prefixes=prefixes) for window in args.aggregatewindows or []] for name, prefixes in MEASUREMENT_PREFIXES.items()
+        }
+        self.aggregate_only = args.aggregateonly
+        if float(args.historyduration) > 0:
+            self.history = {name: HistoryBuffer(float(args.historyduration), float(args.historyresolution)) for name in HISTORY_CATEGORIES}
+            self.mqtt.subscribe_to("/history/get/+", self.__on_mqtt_get_history)
+
+        if self.change_filter is not None:
+            self.mqtt.events.connected += self.change_filter.forget  # publish everything again after a reconnect
+        self.mqtt.subscribe_to("/db/get/+", self.__on_mqtt_get_year)
+        self.mqtt.subscribe_to("/db/get/+/+", self.__on_mqtt_get_month)
+        self.mqtt.subscribe_to("/db/get/+/+/+", self.__on_mqtt_get_day)
+        self.e3dc = self.__create_e3dc_client(args)
+
+        self.scheduler.add("system_info", polling["system_info"]["interval"], polling["system_info"]["priority"], self.__poll_system_info)
+        if args.batchrequests:
+            self.__add_batched_categories(polling)
+        else:
+            self.scheduler.add("power_data", polling["power_data"]["interval"], polling["power_data"]["priority"], self.__poll_power_data)
+            self.scheduler.add("battery_data", polling["battery_data"]["interval"], polling["battery_data"]["priority"], self.__poll_battery_data)
+            self.scheduler.add("pvi_data", polling["pvi_data"]["interval"], polling["pvi_data"]["priority"], self.__poll_pvi_data)
+            self.scheduler.add("live", polling["live"]["interval"], polling["live"]["priority"], self.__poll_live_data)
+        self.scheduler.add("db_data", polling["db_data"]["interval"], polling["db_data"]["priority"], self.__poll_db_data)
+        if args.adaptivepolling:
+            self.__start_adaptive_polling(args, polling)
+        self.scheduler.add("topology", polling["topology"]["interval"], polling["topology"]["priority"], self.__poll_topology)
+        self.mqtt.subscribe_to("/system_info/refresh", self.__on_mqtt_refresh_system_info)
+        self.mqtt.subscribe_to("/backfill/start", self.__on_mqtt_backfill_start)
+        self.mqtt.subscribe_to("/backfill/stop", self.__on_mqtt_backfill_stop)
+
+    def __add_batched_categories(self, polling: dict):
+        """One poll category per interval, polling all of its categories with combined RSCP frames, e.g. live+power_data+battery_data+pvi_data"""
+        groups = {}
+        for name in BATCHED_CATEGORIES:
+            groups.setdefault(float(polling[name]["interval"]), []).append(name)
+        for interval, names in groups.items():
+            priority = min(polling[name]["priority"] for name in names)
+            self.scheduler.add("+".join(names), interval, priority, lambda category, names=names: self.__poll_batch(names, category))
+
+    def __start_adaptive_polling(self, args, polling: dict):
+        """live and the categories polled on the same interval follow the adaptive interval, others keep theirs"""
+        interval = float(polling["live"]["interval"])
+        self.adaptive = AdaptiveInterval(interval, float(args.adaptiveintervalmin), float(args.adaptiveintervalmax), float(args.adaptivethreshold), ENERGY_PREFIXES["live"])
+        self.adaptive_categories = [
+            category for category in self.scheduler.categories.values() if category.interval == interval and all(name in BATCHED_CATEGORIES for name in category.name.split("+"))
+        ]
+        for category in self.adaptive_categories:
+            category.interval = self.adaptive.interval
+
+    async def backfill(self, args):
+        """Runs a single backfill job as given on the command line"""
+        self.args = args
+        device_args = args
+        for device in self.__get_devices_config(args):
+            if device.name == args.backfilldevice:
+                device_args = device
+        self.e3dc = self.__create_e3dc_client(device_args)
+        sinks = []
+        if not args.backfillnomqtt:
+            self.mqtt = self.__create_mqtt_client(args)
+            await self.mqtt.start()
+            sinks.append(MqttSink(self.mqtt.scope(device_args.mqttbasetopic).publish))
+        if args.backfilloutput is not None:
+            sinks.append(open_file_sink(args.backfilloutput, args.backfillformat, get_serializer(args.serializer)))
+
+        to = args.backfillto if args.backfillto is not None else date.today()
+        job = self.__create_backfill_job(args.backfilltimespan, args.backfillfrom, to, device_args.backfillrate, device_args.backfillcheckpoint, sinks)
+        try:
+            await job.run()
         finally:
-            LOGGER.info(f"shutdown requested")
+            for sink in sinks:
+                sink.close()
+
+    def __create_mqtt_client(self, args) -> MqttClient:
+        return MqttClient(
+            LOGGER,
+            self.loop,
+            args.mqttbroker,
+            args.mqttport,
+            args.mqttclientid,
+            args.mqttkeepalive,
+            args.mqttusername,
+            args.mqttpassword,
+            args.mqttbasetopic,
+            self.mqtt_client,
+            get_serializer(args.serializer),
+            int(args.publishqueuesize),
+            int(args.publishqueuebytes),
+            float(args.publishflushinterval),
+        )
+
+    def __create_e3dc_client(self, args):
+        e3dc_factory = self.e3dc_factory
+        topology_file = args.topologyfile or None
+        topology = None
+        if args.replayfile is not None:
+            e3dc_factory = ReplayE3DC.factory(args.replayfile, float(args.replayspeed))
+            # poll what was polled when recording, the topology file belongs to the real device
+            topology_file = None
+            topology = ReplayE3DC.recorded_topology(args.replayfile)
+        if args.recordfile is not None:
+            self.capture = CaptureWriter(args.recordfile)
+            e3dc_factory = RecordingE3DC.factory(e3dc_factory or E3DC, self.capture)
+        return E3DCClient(
+            args.e3dchost or args.replayfile,
+            args.e3dcusername,
+            args.e3dcpassword,
+            args.e3dcrscpkey,
+            args.e3dctimeout,
+            args.systeminfottl,
+            e3dc_factory,
+            DbDataCache(args.dbcachesize, args.dbcachettl),
+            topology_file,
+            topology,
+            self.capture.record_topology if self.capture is not None else None,
+        )
+
+    def __create_backfill_job(self, timespan: str, start: date, end: date, rate: float, checkpoint: str, sinks: list, on_progress=None) -> BackfillJob:
+        db_timespan = DbTimespan[timespan.upper()]
+
+        async def fetch(period: date):
+            # closed periods are requested once only, keep them out of the DB cache
+            return await self.e3dc.get_db_data(period, db_timespan, priority=BACKFILL_PRIORITY, use_cache=False)
+
+        return BackfillJob(fetch, timespan, start, end, rate, sinks, BackfillCheckpoint(checkpoint), on_progress)
+
+    async def stop(self):
+        for device in self.devices:
+            await device.stop()
+        if self.backfill_task is not None:
+            self.backfill_task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.e3dc is not None:
+            await self.e3dc.stop()
+        if self.capture is not None:
+            self.capture.close()
+        if self.mqtt is not None:
             await self.mqtt.stop()
+        if self.store_forward is not None:
+            self.store_forward.close()
+        if self.tracer is not None and self.parent is None:
+            self.tracer.close()
+
+    def __get_polling_config(self, args) -> dict:
+        polling = {name: dict(settings) for name, settings in DEFAULT_POLLING.items()}
+        for name, settings in (getattr(args, "polling", None) or {}).items():
+            if name not in polling:
+                LOGGER.error(f"unknown polling category {name}, allowed values: {', '.join(DEFAULT_POLLING)}")
+                return None
+            polling[name].update(settings)
+        for entry in args.pollinterval or []:
+            name, _, interval = entry.partition("=")
+            if name not in polling:
+                LOGGER.error(f"unknown polling category {name}, allowed values: {', '.join(DEFAULT_POLLING)}")
+                return None
+            polling[name]["interval"] = float(interval)
+
+        for name, settings in polling.items():
+            if settings["interval"] is None:
+                settings["interval"] = float(args.interval)
+            if float(settings["interval"]) < 1:
+                LOGGER.error(f"interval of {name} must be >= 1")
+                return None
+        return polling
+
+    def __get_publishing_config(self, args) -> dict:
+        publishing = {name: dict(settings) for name, settings in (getattr(args, "publishing", None) or {}).items()}
+        for entry in args.publishqos or []:
+            name, _, qos = entry.partition("=")
+            publishing.setdefault(name, {})["qos"] = int(qos) if qos.isdigit() else qos
+        for entry in args.publishretain or []:
+            name, _, retain = entry.partition("=")
+            publishing.setdefault(name, {})["retain"] = {"true": True, "false": False}.get(retain.lower(), retain)
+        for entry in args.publishcodec or []:
+            name, _, codec = entry.partition("=")
+            publishing.setdefault(name, {})["codec"] = codec
+
+        for name, settings in publishing.items():
+            if name not in PUBLISH_CATEGORIES:
+                LOGGER.error(f"unknown publishing category {name}, allowed values: {', '.join(PUBLISH_CATEGORIES)}")
+                return None
+            if settings.get("qos", 0) not in [0, 1, 2]:
+                LOGGER.error(f"QoS of {name} must be 0, 1 or 2")
+                return None
+            if not isinstance(settings.get("retain", False), bool):
+                LOGGER.error(f"retain of {name} must be true or false")
+                return None
+            if settings.get("codec", "json") not in CODECS:
+                LOGGER.error(f"unknown codec {settings['codec']} of {name}, allowed values: {', '.join(CODECS)}")
+                return None
+            try:
+                get_serializer(settings.get("codec", "json"))
+            except ImportError as e:
+                LOGGER.error(f"codec {settings['codec']} of {name} requested, but {e}")
+                return None
+        return publishing
+
+    def __received(self, name: str, payload):
+        LOGGER.debug("received %s:\r\n%s", name, LazyJson(payload))
+        if self.tracer is not None:
+            self.tracer.trace(name if self.name is None else f"{self.name} {name}", payload)
+
+    def __publish_data(self, topic: str, payload):
+        if self.publish_json:
+            self.__publish_if_changed(topic, payload)
+        if self.flat_topics is not None:
+            for value_topic, value in self.flat_topics.flatten(topic, payload):
+                self.__publish_if_changed(value_topic, value)
+
+    def __publish_if_changed(self, topic: str, payload):
+        if self.change_filter is not None and not self.change_filter.should_publish(topic, payload):
+            return
+        self.__publish(topic, payload)
+
+    def __publish(self, topic: str, payload, retain: bool = False):
+        if self.mqtt.is_connected:
+            if self.store_forward is not None:
+                self.store_forward.replay_if_pending(self.mqtt)
+            qos, category_retain, codec = self.__publish_options(topic, retain)
+            self.mqtt.publish(topic, payload, qos, category_retain, codec=codec)
+        elif self.store_forward is not None and not retain:
+            self.store_forward.store(topic, payload)
+
+    def __publish_options(self, topic: str, retain: bool = False) -> tuple:
+        """QoS, retain flag and codec of a topic as set for its category, the first part of the topic"""
+        category = topic.split("/", 1)[0]
+        settings = self.publishing.get(category)
+        if settings is None:
+            return 0, retain, None
+        return settings.get("qos", 0), settings.get("retain", retain), self.codecs.get(category)
+
+    def __mqtt_ready(self) -> bool:
+        if not self.mqtt.is_connected:
+            if self.store_forward is not None:
+                return True  # keep polling, samples are buffered until the broker is back
+            if not self.__polls_skipped:
+                # once, not for every category on every tick
+                LOGGER.error(f"mqtt not connected, polls skipped until it is connected again")
+                self.__polls_skipped = True
+            return False
+        if self.__polls_skipped:
+            LOGGER.info(f"mqtt connected again, polls resumed")
+            self.__polls_skipped = False
+        if self.mqtt.is_congested:
+            # the broker does not keep up, skip polls until the publish queue drained
+            LOGGER.debug(f"publish queue full, poll skipped")
+            return False
+        return True
+
+    async def __poll_system_info(self, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        system_info = await self.e3dc.get_system_info(category.priority)
+        if system_info == self.__published_system_info or not self.mqtt.is_connected:
+            return
+        self.__received("system info", system_info)
+        self.__publish("system_info", system_info, retain=True)
+        self.__published_system_info = system_info
+
+    async def __poll_power_data(self, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        self.__publish_power_data(await self.e3dc.get_powermeter_data(category.priority))
+
+    def __publish_power_data(self, power_data):
+        self.__received("powermeter data", power_data)
+        self.__aggregate("power_data", power_data)
+        self.__record_history("power_data", power_data)
+        if not self.aggregate_only:
+            self.__publish_data("power_data", power_data)
+
+    async def __poll_battery_data(self, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        self.__publish_battery_data(await self.e3dc.get_battery_data(category.priority))
+
+    def __publish_battery_data(self, battery_data):
+        self.__received("battery data", battery_data)
+        for idx, bat in enumerate(battery_data):
+            self.__publish_data(f"battery_data/{idx}", bat)
+
+    async def __poll_pvi_data(self, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        self.__publish_pvi_data(await self.e3dc.get_pvi_data(category.priority))
+
+    def __publish_pvi_data(self, pvi_data):
+        self.__received("pvi data", pvi_data)
+        for idx, pvi in enumerate(pvi_data):
+            self.__publish_data(f'pvi_data/{pvi["index"]}', pvi)
+
+    async def __poll_live_data(self, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        self.__publish_live_data(await self.e3dc.get_live_data(category.priority))
+
+    def __publish_live_data(self, live_data):
+        self.__received("live data", live_data)
+        self.__aggregate("live", live_data)
+        self.__record_history("live", live_data)
+        if self.adaptive is not None:
+            interval = self.adaptive.update(live_data)
+            for category in self.adaptive_categories:
+                category.interval = interval
+        if not self.aggregate_only:
+            self.__publish_data("live", live_data)
+
+    def __aggregate(self, name: str, payload):
+        now = time.time()
+        for aggregator in self.aggregators.get(name, []):
+            aggregate = aggregator.add(now, payload)
+            if aggregate is None:
+                continue
+            # every window is new, so aggregates bypass the change filter
+            topic = f"{name}/aggregate/{aggregator.name}"
+            if self.publish_json:
+                self.__publish(topic, aggregate)
+            if self.flat_topics is not None:
+                for value_topic, value in self.flat_topics.flatten(topic, aggregate):
+                    self.__publish(value_topic, value)
+
+    def __record_history(self, name: str, payload):
+        if name in self.history:
+            self.history[name].add(time.time(), payload)
+
+    async def __poll_batch(self, names: list, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        data = await self.e3dc.get_batch(names, category.priority)
+        publishers = {"live": self.__publish_live_data, "power_data": self.__publish_power_data, "battery_data": self.__publish_battery_data, "pvi_data": self.__publish_pvi_data}
+        for name in names:
+            publishers[name](data[name])
+
+    async def __poll_db_data(self, category: PollCategory):
+        if not self.__mqtt_ready():
+            return
+        db_data_day = await self.e3dc.get_db_data_day(priority=category.priority)
+        if db_data_day is not None:
+            self.__received("db data DAY", db_data_day)
+            self.__publish(f"db/data/{db_data_day['date']}", db_data_day)
+            self.__publish(f"db/data/daily", db_data_day)
+
+        db_data_month = await self.e3dc.get_db_data_month(priority=category.priority)
+        if db_data_month is not None:
+            self.__received("db data MONTH", db_data_month)
+            self.__publish(f"db/data/{db_data_month['date']}", db_data_month)
+
+    async def __poll_topology(self, category: PollCategory):
+        if category.runs == 0:
+            return  # loaded from the topology file or discovered on first use
+        await self.e3dc.discover_topology(category.priority)
+
+    async def __publish_metrics(self, category: PollCategory):
+        if self.mqtt.is_connected:
+            self.mqtt.publish("$SYS/metrics", REGISTRY.snapshot())
+
+    def __on_mqtt_refresh_system_info(self, client, userdata, msg):
+        coroutine = self.__refresh_system_info()
+        self.loop.create_task(coroutine)
+
+    async def __refresh_system_info(self):
+        try:
+            self.e3dc.invalidate_static_data()
+            self.__published_system_info = None
+            await self.__poll_system_info(self.scheduler.categories["system_info"])
+        except Exception as e:
+            LOGGER.exception("exception in __refresh_system_info")
+
+    def __on_mqtt_backfill_start(self, client, userdata, msg):
+        command = {key: value for key, value in getattr(msg.payload, "__dict__", {}).items() if key != "input_string"}
+        coroutine = self.__start_backfill_from_mqtt(command)
+        self.loop.create_task(coroutine)
+
+    def __on_mqtt_backfill_stop(self, client, userdata, msg):
+        if self.backfill_task is not None:
+            self.loop.call_soon_threadsafe(self.backfill_task.cancel)
+
+    async def __start_backfill_from_mqtt(self, command: dict):
+        if self.backfill_task is not None and not self.backfill_task.done():
+            LOGGER.error("backfill already running, stop it first")
+            return
+        try:
+            timespan = command.get("timespan", "day")
+            if timespan not in TIMESPANS:
+                raise ValueError(f"invalid timespan {timespan}")
+            start = date.fromisoformat(command["from"])
+            end = date.fromisoformat(command["to"]) if "to" in command else date.today()
+            rate = float(command.get("rate", self.args.backfillrate))
+            if rate <= 0:
+                raise ValueError(f"rate must be > 0")
+        except (KeyError, ValueError, TypeError) as e:
+            LOGGER.error(f"invalid backfill command {command}: {e}")
+            self.__publish("backfill/status", {"state": "invalid", "message": f"invalid command: {e}"}, retain=True)
+            return
+
+        # published like the polled DB data, so buffering and the output mode apply
+        sinks = [MqttSink(self.__publish)]
+        job = self.__create_backfill_job(timespan, start, end, rate, self.args.backfillcheckpoint, sinks, lambda job: self.__publish("backfill/status", job.status(), retain=True))
+        self.backfill_task = asyncio.ensure_future(job.run())
+        try:
+            await self.backfill_task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            LOGGER.exception("exception in backfill")
 
     def __on_mqtt_get_year(self, client, userdata, msg):
         matches = re.findall(r"\/(\d+$)", msg.topic, re.MULTILINE)
         if len(matches) < 1 or len(matches[0]) < 1:
-            LOGGER.error(f"failed to parse /yyyy from topic {msg.topic}")
+            self.__reject_db_request(msg, "/yyyy")
             return None
         year = int(matches[0])
-        coroutine = self.__fetch_db_from_mqtt(DbTimespan.YEAR, year)
-        self.loop.create_task(coroutine)
+        self.__handle_db_request(msg, DbTimespan.YEAR, year)
 
     def __on_mqtt_get_month(self, client, userdata, msg):
         matches = re.findall(r"\/(\d+)\/(\d+$)", msg.topic, re.MULTILINE)
         if len(matches) < 1 or len(matches[0]) < 2:
-            LOGGER.error(f"failed to parse /yyyy/mm from topic {msg.topic}")
+            self.__reject_db_request(msg, "/yyyy/mm")
             return None
         year = int(matches[0][0])
         month = int(matches[0][1])
-        coroutine = self.__fetch_db_from_mqtt(DbTimespan.MONTH, year, month)
-        self.loop.create_task(coroutine)
+        self.__handle_db_request(msg, DbTimespan.MONTH, year, month)
 
     def __on_mqtt_get_day(self, client, userdata, msg):
         matches = re.findall(r"\/(\d+)\/(\d+)\/(\d+$)", msg.topic, re.MULTILINE)
         if len(matches) < 1 or len(matches[0]) < 3:
-            LOGGER.error(f"failed to parse /yyyy/mm/dd from topic {msg.topic}")
+            self.__reject_db_request(msg, "/yyyy/mm/dd")
             return None
         year = int(matches[0][0])
         month = int(matches[0][1])
         day = int(matches[0][2])
-        coroutine = self.__fetch_db_from_mqtt(DbTimespan.DAY, year, month, day)
-        self.loop.create_task(coroutine)
+        self.__handle_db_request(msg, DbTimespan.DAY, year, month, day)
 
-    async def __fetch_db_from_mqtt(self, timespan: DbTimespan, year: int, month: int = None, day: int = None):
+    def __reject_db_request(self, msg, expected: str):
+        LOGGER.error(f"failed to parse {expected} from topic {msg.topic}")
+        request = MqttRequest.from_message(msg)
+        if request is not None:
+            self.requests.reject(request, "invalid_request", f"expected {expected} at the end of the topic")
+
+    def __handle_db_request(self, msg, timespan: DbTimespan, year: int, month: int = None, day: int = None):
+        request = MqttRequest.from_message(msg)
+        if request is not None:
+            # MQTT v5 request: only the requester gets the result, on its response topic
+            self.requests.submit(request, lambda: self.__fetch_db(timespan, year, month, day))
+        else:
+            coroutine = self.__fetch_db_from_mqtt(timespan, year, month, day)
+            self.loop.create_task(coroutine)
+
+    async def __fetch_db(self, timespan: DbTimespan, year: int, month: int = None, day: int = None):
         try:
             if timespan == DbTimespan.YEAR:
                 request_date = date(year, 1, 1)
-                topic_attachment = f"{year}"
             elif timespan == DbTimespan.MONTH:
                 request_date = date(year, month, 1)
-                topic_attachment = f"{year}/{str(month).zfill(2)}"
             else:
                 request_date = date(year, month, day)
-                topic_attachment = f"{year}/{str(month).zfill(2)}/{str(day).zfill(2)}"
+        except ValueError as e:
+            raise RequestError("invalid_request", f"invalid date: {e}")
 
-            if request_date > date.today():
-                LOGGER.error(f"invalid request_date: {request_date}")
-                return
+        if request_date > date.today():
+            raise RequestError("invalid_request", f"date {request_date} is in the future")
 
-            data = await self.e3dc.get_db_data(request_date, timespan)
+        data = await self.e3dc.get_db_data(request_date, timespan)
+        if data is None:
+            raise RequestError("not_available", f"no data available for {request_date}")
+        return data
+
+    def __on_mqtt_get_history(self, client, userdata, msg):
+        category = msg.topic.rsplit("/", 1)[-1]
+        params = {key: value for key, value in getattr(msg.payload, "__dict__", {}).items() if key != "input_string"}
+        request = MqttRequest.from_message(msg)
+        if request is not None:
+            self.requests.submit(request, lambda: self.__query_history(category, params))
+        else:
+            coroutine = self.__query_history_from_mqtt(category, params)
+            self.loop.create_task(coroutine)
+
+    async def __query_history(self, category: str, params: dict):
+        history = self.history.get(category)
+        if history is None:
+            raise RequestError("invalid_request", f"no history of {category}, available: {', '.join(self.history)}")
+        try:
+            start, end, step = history.query_params(params)
+        except (ValueError, TypeError) as e:
+            raise RequestError("invalid_request", f"invalid history query: {e}")
+        # a day at 1 s resolution takes a moment to downsample, keep the poll loop running meanwhile,
+        # on a copy, as the poll loop adds samples
+        data = await self.loop.run_in_executor(None, history.copy().query, start, end, step)
+        data["category"] = category
+        return data
+
+    async def __query_history_from_mqtt(self, category: str, params: dict):
+        try:
+            data = await self.__query_history(category, params)
+            self.mqtt.publish(f"history/data/{category}", data)
+        except RequestError as e:
+            LOGGER.error(f"invalid history request: {e.message}")
+
+    async def __fetch_db_from_mqtt(self, timespan: DbTimespan, year: int, month: int = None, day: int = None):
+        try:
+            if timespan == DbTimespan.YEAR:
+                topic_attachment = f"{year}"
+            elif timespan == DbTimespan.MONTH:
+                topic_attachment = f"{year}/{str(month).zfill(2)}"
+            else:
+                topic_attachment = f"{year}/{str(month).zfill(2)}/{str(day).zfill(2)}"
+
+            data = await self.__fetch_db(timespan, year, month, day)
             self.mqtt.publish(f"db/data/{topic_attachment}", data)
+        except RequestError as e:
+            LOGGER.error(f"invalid db request: {e.message}")
         except Exception as e:
             LOGGER.exception("exception in __fetch_db_from_mqtt")
 
 
 class E3DCClient:
-    def __init__(self, host: str, username: str, password: str, rscp_key: str) -> None:
-        self.__e3dc = E3DC(E3DC.CONNECT_LOCAL, username=username, password=password, ipAddress=host, key=rscp_key)
-        self.__num_batteries = 5
-        self.__num_pvi_trackers = 5
-        self.__pm_index = None
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        rscp_key: str,
+        timeout: float = DEFAULT_ARGS["e3dctimeout"],
+        static_ttl: float = DEFAULT_ARGS["systeminfottl"],
+        e3dc_factory=None,
+        db_cache: DbDataCache = None,
+        topology_file: str = None,
+        topology: Topology = None,
+        on_topology=None,
+    ) -> None:
+        self.__host = host
+        self.__username = username
+        self.__password = password
+        self.__rscp_key = rscp_key
+        self.__e3dc = None  # type: E3DC
+        self.__e3dc_factory = e3dc_factory or E3DC
+        self.__topology_file = topology_file
+        # a given topology is used as is and never discovered again
+        self.__fixed_topology = topology is not None
+        self.__on_topology = on_topology
+        self.topology = topology if topology is not None else Topology.load(topology_file)
+        if self.topology.complete and on_topology is not None:
+            on_topology(self.topology)
         self.__last_db_data_day = date.fromtimestamp(0)
         self.__last_db_data_month = -1
-        self.__lock = asyncio.Lock()
+        self.__worker = RscpWorker(f"rscp-{host}", timeout)
+        self.__batch = BatchedPoll()
+        self.__static_cache = TtlCache(static_ttl)
+        self.__db_cache = db_cache if db_cache is not None else DbDataCache()
 
-    async def get_system_info(self):
-        await self.__lock.acquire()
-        try:
-            self.__e3dc.get_system_info_static()
-            data = self.__e3dc.get_system_info()
-            return data
-        finally:
-            self.__lock.release()
+    async def stop(self):
+        await self.__worker.stop()
 
-    def __find_power_meter_index(self) -> int:
-        indices = [0, 6, 1, 2, 3, 4, 5]
-        for index in indices:
-            try:
-                LOGGER.debug(f"testing powermeter index {index}")
-                power_data = self.__e3dc.get_powermeter_data(pmIndex=index)
-                if power_data is not None:
-                    LOGGER.debug(f"Powermeter index {index} found")
-                    return index
-            except Exception:
-                LOGGER.debug(f"Powermeter index {index} failed")
-        return None
-
-    async def get_powermeter_data(self):
-        await self.__lock.acquire()
+    def invalidate_static_data(self):
+        self.__static_cache.invalidate()
+
+    async def __call(self, func, *args, priority: int = 0):
         try:
-            if self.__pm_index is None:
-                self.__pm_index = self.__find_power_meter_index()
+            return await self.__worker.call(func, *args, priority=priority)
+        except NotAvailableError:
+            raise
+        except Exception:
+            # the device may have been restarted or updated, re-read static values on next request
+            self.invalidate_static_data()
+            raise
 
-            data = self.__e3dc.get_powermeter_data(pmIndex=self.__pm_index)
-            return data
-        finally:
-            self.__lock.release()
+    def __connection(self) -> E3DC:
+        # runs on the worker thread, E3DC() already talks to the device
+        if self.__e3dc is None:
+            self.__e3dc = self.__e3dc_factory(E3DC.CONNECT_LOCAL, username=self.__username, password=self.__password, ipAddress=self.__host, key=self.__rscp_key)
+        return self.__e3dc
 
-    async def get_battery_data(self):
-        await self.__lock.acquire()
-        try:
-            data = []
-            for i in range(0, self.__num_batteries):
-                try:
-                    battery_data = self.__e3dc.get_battery_data(batIndex=i)
-                    if battery_data is None:
-                        break
-                    else:
-                        data.append(battery_data)
-                except NotAvailableError:
-                    break
-            self.__num_batteries = len(data)
-            return data
-        finally:
-            self.__lock.release()
+    async def get_system_info(self, priority: int = 0):
+        data = self.__static_cache.get("system_info")
+        if data is None:
+            data = await self.__call(self.__get_system_info, priority=priority)
+            self.__static_cache.set("system_info", data)
+        return data
 
-    async def get_pvi_data(self):
-        await self.__lock.acquire()
-        try:
-            data = []
-            for i in range(0, self.__num_pvi_trackers):
-                try:
-                    string_index = 0
-                    pvi_data = self.__e3dc.get_pvi_data(stringIndex=string_index, pviTracker=i)
-                    if pvi_data is None:
-                        break
-                    else:
-                        data.append(pvi_data)
-                except:
-                    break
-            self.__num_pvi_trackers = len(data)
-            return data
-        finally:
-            self.__lock.release()
+    def __get_system_info(self):
+        if self.__e3dc is None:
+            e3dc = self.__connection()  # constructor already read the static values
+        else:
+            e3dc = self.__connection()
+            e3dc.get_system_info_static()
+        return e3dc.get_system_info()
+
+    async def discover_topology(self, priority: int = 0) -> Topology:
+        """Probes the device for power meters, batteries and PV inverters again and saves the result if it changed"""
+        if self.__fixed_topology:
+            return self.topology
+        return await self.__call(self.__discover_topology, priority=priority)
 
-    async def get_live_data(self):
-        await self.__lock.acquire()
+    def __discover_topology(self) -> Topology:
         try:
-            data = self.__e3dc.poll()
-            data["time"] = None  # delete from return value because not used and not json serializable
-            return data
-        finally:
-            self.__lock.release()
+            topology = Topology(self.__discover_powermeters(), self.__discover_batteries(), self.__discover_pvis())
+        except (SendError, AuthenticationError) as e:
+            if not self.topology.complete:
+                raise
+            # keep what is known, a device which does not answer must not make hardware disappear
+            LOGGER.warning(f"topology discovery failed, keeping {self.topology}: {e}")
+            return self.topology
+        if topology != self.topology:
+            LOGGER.info(f"discovered topology {topology}")
+            self.topology = topology
+            topology.save(self.__topology_file)
+            if self.__on_topology is not None:
+                self.__on_topology(topology)
+        return topology
 
-    async def get_db_data(self, date: date, timespan: DbTimespan):
-        await self.__lock.acquire()
+    def __probe(self, name: str, index: int, func, **kwargs):
+        """Returns None if the device has nothing at the index, communication errors are raised"""
         try:
-            data = self.__e3dc.get_db_data(startDate=date, timespan=timespan.name)
-            if timespan == DbTimespan.YEAR:
-                data["date"] = date.strftime("%Y")
-            elif timespan == DbTimespan.MONTH:
-                data["date"] = date.strftime("%Y/%m")
+            return func(**kwargs)
+        except (SendError, AuthenticationError):
+            raise
+        except Exception as e:
+            LOGGER.debug(f"{name} index {index} not available: {e!r}")
+            return None
+
+    def __discover_powermeters(self) -> list:
+        for index in POWERMETER_INDICES:
+            LOGGER.debug(f"testing powermeter index {index}")
+            if self.__probe("powermeter", index, self.__connection().get_powermeter_data, pmIndex=index) is not None:
+                LOGGER.debug(f"Powermeter index {index} found")
+                return [{"index": index}]
+        return []
+
+    def __discover_batteries(self) -> list:
+        batteries = []
+        for index in range(MAX_BATTERIES):
+            battery_data = self.__probe("battery", index, self.__connection().get_battery_data, batIndex=index)
+            if battery_data is None:
+                break
+            batteries.append({"index": index, "dcbs": battery_data.get("dcbCount")})
+        return batteries
+
+    def __discover_pvis(self) -> list:
+        pvis = []
+        for index in range(MAX_PVIS):
+            pvi_data = self.__probe("pvi", index, self.__connection().get_pvi_data, pviIndex=index)
+            if pvi_data is None:
+                break
+            pvis.append(
+                {"index": index, "strings": len(pvi_data.get("strings", {})), "phases": len(pvi_data.get("phases", {})), "temperatures": len(pvi_data.get("temperature", {}).get("values", []))}
+            )
+        return pvis
+
+    def __ensure_topology(self):
+        # first use without topology file, later changes are picked up by discover_topology
+        if not self.topology.complete:
+            self.__discover_topology()
+
+    async def get_powermeter_data(self, priority: int = 0):
+        return await self.__call(self.__get_powermeter_data, priority=priority)
+
+    def __get_powermeter_data(self):
+        self.__ensure_topology()
+        pm_index = self.topology.powermeters[0]["index"] if self.topology.powermeters else None
+        return self.__connection().get_powermeter_data(pmIndex=pm_index)
+
+    async def get_battery_data(self, priority: int = 0):
+        return await self.__call(self.__get_battery_data, priority=priority)
+
+    def __get_battery_data(self):
+        self.__ensure_topology()
+        e3dc = self.__connection()
+        data = []
+        for battery in self.topology.batteries:
+            try:
+                data.append(self.__read_battery(e3dc, battery))
+            except NotAvailableError:
+                LOGGER.warning(f"battery {battery['index']} not available")
+        return data
+
+    def __read_battery(self, e3dc: E3DC, battery: dict):
+        return e3dc.get_battery_data(batIndex=battery["index"])
+
+    async def get_pvi_data(self, priority: int = 0):
+        return await self.__call(self.__get_pvi_data, priority=priority)
+
+    def __get_pvi_data(self):
+        self.__ensure_topology()
+        e3dc = self.__connection()
+        data = []
+        for pvi in self.topology.pvis:
+            try:
+                data.append(self.__read_pvi(e3dc, pvi))
+            except NotAvailableError:
+                LOGGER.warning(f"PV inverter {pvi['index']} not available")
+        return data
+
+    def __read_pvi(self, e3dc: E3DC, pvi: dict):
+        request = build_pvi_request(pvi["index"], range(0, pvi["strings"]), range(0, pvi["phases"]), range(0, pvi.get("temperatures", 0)))
+        return parse_pvi_response(pvi["index"], e3dc.sendRequest(request))
+
+    async def get_live_data(self, priority: int = 0):
+        return await self.__call(self.__get_live_data, priority=priority)
+
+    def __get_live_data(self):
+        data = self.__connection().poll()
+        data["time"] = None  # delete from return value because not used and not json serializable
+        return data
+
+    async def get_batch(self, names: list, priority: int = 0) -> dict:
+        """Reads the given categories (live, power_data, battery_data, pvi_data) with combined RSCP frames, returns name -> payload"""
+        return await self.__call(self.__get_batch, names, priority=priority)
+
+    def __get_batch(self, names: list) -> dict:
+        self.__ensure_topology()
+        e3dc = self.__connection()
+        calls = {}
+        if "live" in names:
+            calls["live"] = self.__get_live_data
+        if "power_data" in names:
+            calls["power_data"] = self.__get_powermeter_data
+        if "battery_data" in names:
+            for battery in self.topology.batteries:
+                calls[f"battery_data/{battery['index']}"] = functools.partial(self.__read_battery, e3dc, battery)
+        if "pvi_data" in names:
+            for pvi in self.topology.pvis:
+                calls[f"pvi_data/{pvi['index']}"] = functools.partial(self.__read_pvi, e3dc, pvi)
+        results = self.__batch.run(e3dc, calls)
+
+        data = {}
+        for name in ["live", "power_data"]:
+            if name in names:
+                if isinstance(results[name], Exception):
+                    raise results[name]
+                data[name] = results[name]
+        if "battery_data" in names:
+            data["battery_data"] = self.__available(results, "battery_data", "battery", self.topology.batteries)
+        if "pvi_data" in names:
+            data["pvi_data"] = self.__available(results, "pvi_data", "PV inverter", self.topology.pvis)
+        return data
+
+    def __available(self, results: dict, name: str, label: str, items: list) -> list:
+        data = []
+        for item in items:
+            result = results[f"{name}/{item['index']}"]
+            if isinstance(result, NotAvailableError):
+                LOGGER.warning(f"{label} {item['index']} not available")
+            elif isinstance(result, Exception):
+                raise result
             else:
-                data["date"] = date.strftime("%Y/%m/%d")
-            return data
-        finally:
-            self.__lock.release()
+                data.append(result)
+        return data
+
+    async def get_db_data(self, date: date, timespan: DbTimespan, priority: int = 0, use_cache: bool = True):
+        if not use_cache:
+            return await self.__call(self.__get_db_data, date, timespan, priority=priority)
+        today = date.today()
+        if timespan == DbTimespan.YEAR:
+            closed = date.year < today.year
+        elif timespan == DbTimespan.MONTH:
+            closed = (date.year, date.month) < (today.year, today.month)
+        else:
+            closed = date < today
+        return await self.__db_cache.get((timespan, date), closed, lambda: self.__call(self.__get_db_data, date, timespan, priority=priority))
+
+    def __get_db_data(self, date: date, timespan: DbTimespan):
+        data = self.__connection().get_db_data(startDate=date, timespan=timespan.name)
+        if timespan == DbTimespan.YEAR:
+            data["date"] = date.strftime("%Y")
+        elif timespan == DbTimespan.MONTH:
+            data["date"] = date.strftime("%Y/%m")
+        else:
+            data["date"] = date.strftime("%Y/%m/%d")
+        return data
 
-    async def get_db_data_day(self, force: bool = False):
-        await self.__lock.acquire()
+    async def get_db_data_day(self, force: bool = False, priority: int = 0):
         try:
             today = date.today()
             if force or (today > self.__last_db_data_day):
                 self.__last_db_data_day = today
                 request_date = today - timedelta(days=1)
-                data = self.__e3dc.get_db_data(startDate=request_date, timespan="DAY")
-                data["date"] = request_date.strftime("%Y/%m/%d")
-                return data
+                return await self.get_db_data(request_date, DbTimespan.DAY, priority)
             return None
         except Exception:
             LOGGER.error("failed to get_db_data_day")
-        finally:
-            self.__lock.release()
 
-    async def get_db_data_month(self, force: bool = False):
-        await self.__lock.acquire()
+    async def get_db_data_month(self, force: bool = False, priority: int = 0):
         try:
             today = date.today()
             if force or (today.month > self.__last_db_data_month):
                 self.__last_db_data_month = today.month
                 request_date = today.replace(day=1) - relativedelta(months=1)
-                data = self.__e3dc.get_db_data(startDate=request_date, timespan="MONTH")
-                data["date"] = request_date.strftime("%Y/%m")
-                return data
+                return await self.get_db_data(request_date, DbTimespan.MONTH, priority)
             return None
         except Exception:
             LOGGER.error("failed to get_db_data_month, probably no data available yet")
-        finally:
-            self.__lock.release()
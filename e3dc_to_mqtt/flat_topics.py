@@ -0,0 +1,26 @@
+class FlatTopics:
+    """Splits a payload into one topic per leaf value, e.g. live -> live/production/solar.
+
+    Topic strings are built on first use and cached per (parent topic, key), so a steady
+    payload layout does not cost any string formatting after the first cycle.
+    """
+
+    def __init__(self) -> None:
+        self.__topics = {}
+
+    def flatten(self, topic: str, payload):
+        if isinstance(payload, dict):
+            for key, value in payload.items():
+                yield from self.flatten(self.__child_topic(topic, key), value)
+        elif isinstance(payload, (list, tuple)):
+            for idx, value in enumerate(payload):
+                yield from self.flatten(self.__child_topic(topic, idx), value)
+        elif payload is not None:
+            yield topic, payload
+
+    def __child_topic(self, topic: str, key) -> str:
+        child = self.__topics.get((topic, key))
+        if child is None:
+            child = f"{topic}/{key}"
+            self.__topics[(topic, key)] = child
+        return child
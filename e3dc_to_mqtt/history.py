@@ -0,0 +1,105 @@
+import math
+import time
+from array import array
+from datetime import datetime
+
+from .aggregation import numeric_leaves
+
+MAX_POINTS = 2000
+DEFAULT_POINTS = 500
+
+
+def parse_time(value, now: float) -> float:
+    """Seconds since epoch from a number (negative: relative to now) or an ISO 8601 string"""
+    if isinstance(value, bool):
+        raise ValueError(f"invalid time {value}")
+    if isinstance(value, (int, float)):
+        return now + value if value <= 0 else float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+class HistoryBuffer:
+    """Recent samples of one category in a ring of fixed size with one slot per resolution seconds.
+
+    Sample times and every numeric value are kept in arrays of doubles of the same length, so
+    large energy counters keep their precision. 24 h at 1 s resolution take 691 kB for the
+    times and per value. A sample arriving within the same slot as the previous one replaces it.
+    """
+
+    def __init__(self, duration: float, resolution: float = 1.0) -> None:
+        self.resolution = resolution
+        self.capacity = max(1, int(math.ceil(duration / resolution)))
+        self.__times = array("d", [math.nan]) * self.capacity
+        self.__values = {}  # type: dict[str, array]
+
+    @property
+    def fields(self) -> list:
+        return list(self.__values.keys())
+
+    def add(self, timestamp: float, payload):
+        slot = int(timestamp // self.resolution) % self.capacity
+        self.__times[slot] = timestamp
+        values = {"/".join(str(key) for key in path): value for path, value in numeric_leaves(payload)}
+        for name, value in values.items():
+            if name not in self.__values:
+                self.__values[name] = array("d", [math.nan]) * self.capacity
+        for name, column in self.__values.items():
+            column[slot] = values.get(name, math.nan)
+
+    def copy(self) -> "HistoryBuffer":
+        """Copy of the buffer to be queried on another thread while samples are added to this one"""
+        buffer = HistoryBuffer.__new__(HistoryBuffer)
+        buffer.resolution = self.resolution
+        buffer.capacity = self.capacity
+        buffer.__times = array("d", self.__times)
+        buffer.__values = {name: array("d", column) for name, column in self.__values.items()}
+        return buffer
+
+    def query(self, start: float, end: float, step: float) -> dict:
+        """Mean of every value per step seconds from start to end, None for steps without samples"""
+        buckets = max(1, int(math.ceil((end - start) / step)))
+        last = int(math.ceil(end / self.resolution))
+        first = max(int(start // self.resolution), last - self.capacity)
+
+        # bucket of every slot from first to last, -1 for slots overwritten or never written
+        slots = []
+        for index in range(first, last):
+            slot = index % self.capacity
+            timestamp = self.__times[slot]
+            if start <= timestamp < end and int(timestamp // self.resolution) == index:
+                slots.append((slot, int((timestamp - start) // step)))
+
+        values = {}
+        for name, column in self.__values.items():
+            totals = [0.0] * buckets
+            counts = [0] * buckets
+            for slot, bucket in slots:
+                value = column[slot]
+                if value == value:  # not NaN
+                    totals[bucket] += value
+                    counts[bucket] += 1
+            values[name] = [round(total / count, 2) if count > 0 else None for total, count in zip(totals, counts)]
+        return {
+            "start": start,
+            "end": end,
+            "step": step,
+            "time": [start + bucket * step for bucket in range(buckets)],
+            "values": values,
+        }
+
+    def query_params(self, params: dict, now: float = None) -> tuple:
+        """start, end and step of a query given as {"from": ..., "to": ..., "points": ... or "step": ...}.
+
+        Default is the whole buffer in DEFAULT_POINTS steps. Raises ValueError for invalid values.
+        """
+        now = time.time() if now is None else now
+        start = parse_time(params["from"], now) if params.get("from") is not None else now - self.capacity * self.resolution
+        end = parse_time(params["to"], now) if params.get("to") is not None else now
+        if end <= start:
+            raise ValueError("to must be after from")
+        if params.get("step") is not None:
+            step = float(params["step"])
+        else:
+            step = (end - start) / int(params.get("points") or DEFAULT_POINTS)
+        step = max(step, self.resolution, (end - start) / MAX_POINTS)
+        return start, end, step
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import math
+import time
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    """Label value escaped as required by the text exposition format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names, label_values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+    child_type = None  # value of one combination of label values
+
+    def __init__(self, name: str, help: str, label_names=()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._children = {}
+
+    def labels(self, *label_values):
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._new_child()
+            self._children[label_values] = child
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        return self.child_type()
+
+
+class _CounterValue:
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+    child_type = _CounterValue
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def samples(self):
+        for label_values, child in list(self._children.items()):
+            yield self.name, _format_labels(self.label_names, label_values), child.value
+
+
+class _GaugeValue:
+    def __init__(self) -> None:
+        self.value = 0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+    child_type = _GaugeValue
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def samples(self):
+        for label_values, child in list(self._children.items()):
+            yield self.name, _format_labels(self.label_names, label_values), child.get()
+
+
+class _HistogramValue:
+    def __init__(self, buckets) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, histogram: _HistogramValue) -> None:
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, label_names=(), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def samples(self):
+        for label_values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.label_names, label_values, f'le="{_format_value(bound)}"'), cumulative
+            yield f"{self.name}_sum", _format_labels(self.label_names, label_values), child.sum
+            yield f"{self.name}_count", _format_labels(self.label_names, label_values), child.count
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.__metrics = {}
+
+    def counter(self, name: str, help: str, label_names=()) -> Counter:
+        return self.__register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names=()) -> Gauge:
+        return self.__register(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.__register(Histogram(name, help, label_names, buckets))
+
+    def __register(self, metric: _Metric):
+        existing = self.__metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.__metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.__metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Flat name -> value dict, histograms are reduced to their _sum and _count"""
+        values = {}
+        for metric in self.__metrics.values():
+            for name, labels, value in metric.samples():
+                if not name.endswith("_bucket"):
+                    values[f"{name}{labels}"] = value
+        return values
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """Minimal HTTP server answering every GET request with the registry in Prometheus text format."""
+
+    def __init__(self, host: str, port: int, registry: MetricsRegistry = REGISTRY) -> None:
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.__server = None
+
+    async def start(self):
+        self.__server = await asyncio.start_server(self.__handle, self.host, self.port)
+        LOGGER.info(f"serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # headers are not used
+
+            if request_line.startswith(b"GET "):
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+            else:
+                status, body = "405 Method Not Allowed", b""
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,89 @@
+import logging
+import time
+from collections import OrderedDict
+
+from .metrics import REGISTRY
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+# at most one warning about dropped messages per interval in seconds
+DROP_WARNING_INTERVAL = 60.0
+
+QUEUE_MESSAGES = REGISTRY.gauge("mqtt_publish_queue_messages", "Messages waiting to be handed to the MQTT client")
+QUEUE_BYTES = REGISTRY.gauge("mqtt_publish_queue_bytes", "Payload bytes waiting to be handed to the MQTT client")
+COALESCED = REGISTRY.counter("mqtt_publish_coalesced_total", "Queued messages replaced by a newer message for the same topic")
+DROPPED = REGISTRY.counter("mqtt_publish_dropped_total", "Queued messages dropped because the queue was full")
+FLUSHES = REGISTRY.counter("mqtt_publish_flushes_total", "Batches of queued messages handed to the MQTT client")
+
+
+class OutboundMessage:
+    def __init__(self, topic: str, data, qos: int = 0, retain: bool = False, properties=None) -> None:
+        self.topic = topic
+        self.data = data
+        self.qos = qos
+        self.retain = retain
+        self.properties = properties
+        self.size = len(data) if isinstance(data, (str, bytes, bytearray)) else len(str(data))
+
+
+class PublishQueue:
+    """Messages waiting to be handed to paho, bounded by number of messages and payload bytes.
+
+    Only the newest message per topic is kept, it replaces the queued one at its place in the
+    queue. Messages put with coalesce=False, like buffered samples carrying their own timestamp,
+    are never replaced. When a limit is exceeded, the oldest messages are dropped, counted in
+    mqtt_publish_dropped_total and logged at most once per DROP_WARNING_INTERVAL.
+    """
+
+    def __init__(self, max_messages: int, max_bytes: int) -> None:
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.__messages = OrderedDict()  # type: OrderedDict[object, OutboundMessage]
+        self.__sequence = 0
+        self.__dropped = 0  # since the last warning
+        self.__last_drop_warning = None  # type: float
+        QUEUE_MESSAGES.set_function(self.__len__)
+        QUEUE_BYTES.set_function(lambda: self.bytes)
+
+    def __len__(self) -> int:
+        return len(self.__messages)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.__messages) >= self.max_messages or self.bytes >= self.max_bytes
+
+    def put(self, message: OutboundMessage, coalesce: bool = True):
+        if coalesce:
+            key = message.topic
+        else:
+            # numbers never equal a topic
+            self.__sequence += 1
+            key = self.__sequence
+        previous = self.__messages.get(key)
+        if previous is not None:
+            self.bytes -= previous.size
+            COALESCED.inc()
+        self.__messages[key] = message
+        self.bytes += message.size
+
+        # a single message larger than max_bytes is still sent
+        while len(self.__messages) > self.max_messages or (self.bytes > self.max_bytes and len(self.__messages) > 1):
+            self.pop()
+            DROPPED.inc()
+            self.__dropped += 1
+        if self.__dropped > 0:
+            self.__warn_dropped()
+
+    def pop(self) -> OutboundMessage:
+        _, message = self.__messages.popitem(last=False)
+        self.bytes -= message.size
+        return message
+
+    def __warn_dropped(self):
+        now = time.monotonic()
+        if self.__last_drop_warning is not None and now - self.__last_drop_warning < DROP_WARNING_INTERVAL:
+            return
+        LOGGER.warning(f"publish queue full, dropped {self.__dropped} messages, consider raising publish-queue-size ({self.max_messages}) or publish-queue-bytes ({self.max_bytes})")
+        self.__dropped = 0
+        self.__last_drop_warning = now
@@ -0,0 +1,136 @@
+import logging
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+PHASE_TAGS = {
+    "PVI_AC_POWER": "power",
+    "PVI_AC_VOLTAGE": "voltage",
+    "PVI_AC_CURRENT": "current",
+    "PVI_AC_APPARENTPOWER": "apparentPower",
+    "PVI_AC_REACTIVEPOWER": "reactivePower",
+    "PVI_AC_ENERGY_ALL": "energyAll",
+    "PVI_AC_ENERGY_GRID_CONSUMPTION": "energyGridConsumption",
+}
+
+STRING_TAGS = {
+    "PVI_DC_POWER": "power",
+    "PVI_DC_VOLTAGE": "voltage",
+    "PVI_DC_CURRENT": "current",
+    "PVI_DC_STRING_ENERGY_ALL": "energyAll",
+}
+
+INVERTER_REQUESTS = [
+    "PVI_REQ_AC_MAX_PHASE_COUNT",
+    "PVI_REQ_TEMPERATURE_COUNT",
+    "PVI_REQ_DC_MAX_STRING_COUNT",
+    "PVI_REQ_USED_STRING_COUNT",
+    "PVI_REQ_TYPE",
+    "PVI_REQ_SERIAL_NUMBER",
+    "PVI_REQ_VERSION",
+    "PVI_REQ_ON_GRID",
+    "PVI_REQ_STATE",
+    "PVI_REQ_LAST_ERROR",
+    "PVI_REQ_COS_PHI",
+    "PVI_REQ_VOLTAGE_MONITORING",
+    "PVI_REQ_POWER_MODE",
+    "PVI_REQ_SYSTEM_MODE",
+    "PVI_REQ_FREQUENCY_UNDER_OVER",
+    "PVI_REQ_MAX_TEMPERATURE",
+    "PVI_REQ_MIN_TEMPERATURE",
+    "PVI_REQ_AC_MAX_APPARENTPOWER",
+    "PVI_REQ_DEVICE_STATE",
+]
+
+
+def build_pvi_request(index: int, strings, phases, temperatures) -> tuple:
+    """One PVI_REQ_DATA container requesting everything of the inverter at index.
+
+    pye3dc's get_pvi_data sends one request per temperature sensor, phase and string in
+    addition, all of them fit into the same container.
+    """
+    tags = [("PVI_INDEX", "Uint16", index)]
+    tags += [(tag, "None", None) for tag in INVERTER_REQUESTS]
+    tags += [("PVI_REQ_TEMPERATURE", "Uint16", temperature) for temperature in temperatures]
+    for phase in phases:
+        tags += [(tag.replace("PVI_", "PVI_REQ_", 1), "Uint16", phase) for tag in PHASE_TAGS]
+    for string in strings:
+        tags += [(tag.replace("PVI_", "PVI_REQ_", 1), "Uint16", string) for tag in STRING_TAGS]
+    return ("PVI_REQ_DATA", "Container", tags)
+
+
+def _values(container) -> dict:
+    return {tag: value for tag, _, value in container} if isinstance(container, list) else {}
+
+
+def _round(value):
+    return round(value, 2) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+
+def parse_pvi_response(index: int, response: tuple) -> dict:
+    """Decodes the PVI_DATA container answering build_pvi_request, in the payload layout of pye3dc's get_pvi_data"""
+    values = {}
+    indexed = {}  # tag -> {index: value}
+    for tag, _, value in response[2]:
+        if tag in PHASE_TAGS or tag in STRING_TAGS or tag == "PVI_TEMPERATURE":
+            item = _values(value)
+            if "PVI_INDEX" not in item:
+                # an error answer (type Error) carries no index to group it by
+                LOGGER.debug(f"PV inverter {index}: {tag} not answered: {value}")
+                continue
+            indexed.setdefault(tag, {})[item["PVI_INDEX"]] = _round(item.get("PVI_VALUE"))
+        else:
+            values[tag] = value
+
+    cos_phi = _values(values.get("PVI_COS_PHI"))
+    device_state = _values(values.get("PVI_DEVICE_STATE"))
+    frequency = _values(values.get("PVI_FREQUENCY_UNDER_OVER"))
+    voltage_monitoring = _values(values.get("PVI_VOLTAGE_MONITORING"))
+
+    data = {
+        "acMaxApparentPower": _values(values.get("PVI_AC_MAX_APPARENTPOWER")).get("PVI_VALUE"),
+        "cosPhi": {
+            "active": cos_phi.get("PVI_COS_PHI_IS_AKTIV"),
+            "value": cos_phi.get("PVI_COS_PHI_VALUE"),
+            "excited": cos_phi.get("PVI_COS_PHI_EXCITED"),
+        },
+        "deviceState": {
+            "connected": device_state.get("PVI_DEVICE_CONNECTED"),
+            "working": device_state.get("PVI_DEVICE_WORKING"),
+            "inService": device_state.get("PVI_DEVICE_IN_SERVICE"),
+        },
+        "frequency": {"under": frequency.get("PVI_FREQUENCY_UNDER"), "over": frequency.get("PVI_FREQUENCY_OVER")},
+        "index": index,
+        "lastError": values.get("PVI_LAST_ERROR"),
+        "maxPhaseCount": values.get("PVI_AC_MAX_PHASE_COUNT"),
+        "maxStringCount": values.get("PVI_DC_MAX_STRING_COUNT"),
+        "onGrid": values.get("PVI_ON_GRID"),
+        "phases": _group(indexed, PHASE_TAGS),
+        "powerMode": values.get("PVI_POWER_MODE"),
+        "serialNumber": values.get("PVI_SERIAL_NUMBER"),
+        "state": values.get("PVI_STATE"),
+        "strings": _group(indexed, STRING_TAGS),
+        "systemMode": values.get("PVI_SYSTEM_MODE"),
+        "temperature": {
+            "max": _values(values.get("PVI_MAX_TEMPERATURE")).get("PVI_VALUE"),
+            "min": _values(values.get("PVI_MIN_TEMPERATURE")).get("PVI_VALUE"),
+            "values": [value for _, value in sorted(indexed.get("PVI_TEMPERATURE", {}).items())],
+        },
+        "type": values.get("PVI_TYPE"),
+        "version": _values(values.get("PVI_VERSION")).get("PVI_VERSION_MAIN"),
+        "voltageMonitoring": {
+            "thresholdTop": voltage_monitoring.get("PVI_VOLTAGE_MONITORING_THRESHOLD_TOP"),
+            "thresholdBottom": voltage_monitoring.get("PVI_VOLTAGE_MONITORING_THRESHOLD_BOTTOM"),
+            "slopeUp": voltage_monitoring.get("PVI_VOLTAGE_MONITORING_SLOPE_UP"),
+            "slopeDown": voltage_monitoring.get("PVI_VOLTAGE_MONITORING_SLOPE_DOWN"),
+        },
+    }
+    return data
+
+
+def _group(indexed: dict, tags: dict) -> dict:
+    """{index: {name: value}} for every index any of the tags was answered for"""
+    grouped = {}
+    for tag, name in tags.items():
+        for index, value in indexed.get(tag, {}).items():
+            grouped.setdefault(index, {})[name] = value
+    return dict(sorted(grouped.items()))
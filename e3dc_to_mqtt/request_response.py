@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+
+from .metrics import REGISTRY
+from .rscp_worker import RscpTimeoutError
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+REQUESTS = REGISTRY.counter("mqtt_requests_total", "MQTT v5 requests by result: ok, invalid_request, busy, timeout or failed", ["result"])
+REQUEST_DURATION = REGISTRY.histogram("mqtt_request_duration_seconds", "Time from receiving an MQTT v5 request until the reply was published")
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("mqtt_requests_in_flight", "MQTT v5 requests currently waiting or being processed")
+
+
+class RequestError(Exception):
+    def __init__(self, code: str, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class MqttRequest:
+    """Reply address of an MQTT v5 request, taken from its ResponseTopic, CorrelationData and ContentType properties."""
+
+    def __init__(self, topic: str, response_topic: str, correlation_data: bytes, content_type: str = None) -> None:
+        self.topic = topic
+        self.response_topic = response_topic
+        self.correlation_data = correlation_data
+        self.content_type = content_type
+        self.received = time.perf_counter()
+
+    @staticmethod
+    def from_message(msg):
+        """Returns None if the sender did not ask for a reply"""
+        properties = getattr(msg, "properties", None)
+        response_topic = getattr(properties, "ResponseTopic", None)
+        if not response_topic:
+            return None
+        return MqttRequest(msg.topic, response_topic, getattr(properties, "CorrelationData", None), getattr(properties, "ContentType", None))
+
+
+class RequestHandler:
+    """Answers MQTT v5 requests on the requester's response topic.
+
+    At most max_concurrency requests are processed at the same time, further requests wait
+    for a free slot. Requests beyond max_pending are rejected right away. A request which is
+    not answered within timeout seconds (including the time waiting for a slot) gets an error
+    reply. Successful replies carry the result as payload, failed ones
+    {"error": {"code": ..., "message": ...}}, both with the user property status=ok|error and
+    encoded in the content type of the request.
+    """
+
+    def __init__(self, mqtt_client, loop: asyncio.AbstractEventLoop, max_concurrency: int = 4, max_pending: int = 32, timeout: float = 30.0) -> None:
+        self.mqtt = mqtt_client
+        self.loop = loop
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.__slots = None  # type: asyncio.Semaphore
+        self.__max_concurrency = max_concurrency
+        self.__pending = 0
+        REQUESTS_IN_FLIGHT.set_function(lambda: self.__pending)
+
+    @property
+    def pending(self) -> int:
+        return self.__pending
+
+    def submit(self, request: MqttRequest, handler):
+        """Schedules handler, a coroutine function, and replies with its result. Safe to call from the MQTT network thread."""
+        asyncio.run_coroutine_threadsafe(self.__process(request, handler), self.loop)
+
+    def reject(self, request: MqttRequest, code: str, message: str):
+        """Replies with an error without processing anything. Safe to call from the MQTT network thread."""
+        self.loop.call_soon_threadsafe(self.__reply_error, request, code, message)
+
+    async def __process(self, request: MqttRequest, handler):
+        if self.__pending >= self.max_pending:
+            self.__reply_error(request, "busy", f"too many pending requests ({self.max_pending})")
+            return
+        if self.__slots is None:
+            self.__slots = asyncio.Semaphore(self.__max_concurrency)
+
+        self.__pending += 1
+        try:
+            result = await asyncio.wait_for(self.__run(handler), self.timeout)
+        except RequestError as e:
+            self.__reply_error(request, e.code, e.message)
+        except (asyncio.TimeoutError, RscpTimeoutError):
+            self.__reply_error(request, "timeout", f"no result within {self.timeout}s")
+        except Exception as e:
+            LOGGER.exception(f"exception processing request on {request.topic}")
+            self.__reply_error(request, "failed", str(e))
+        else:
+            self.__reply(request, result, "ok")
+        finally:
+            self.__pending -= 1
+
+    async def __run(self, handler):
+        async with self.__slots:
+            return await handler()
+
+    def __reply_error(self, request: MqttRequest, code: str, message: str):
+        LOGGER.warning(f"request on {request.topic} failed: {code}: {message}")
+        self.__reply(request, {"error": {"code": code, "message": message}}, code)
+
+    def __reply(self, request: MqttRequest, payload, result: str):
+        REQUESTS.labels(result).inc()
+        REQUEST_DURATION.observe(time.perf_counter() - request.received)
+        if not self.mqtt.is_connected:
+            LOGGER.warning(f"not connected, dropping reply to {request.response_topic}")
+            return
+        self.mqtt.publish_response(request.response_topic, request.correlation_data, payload, "ok" if result == "ok" else "error", request.content_type)
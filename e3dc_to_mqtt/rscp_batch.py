@@ -0,0 +1,158 @@
+import copy
+import logging
+import struct
+
+from e3dc._e3dc import AuthenticationError, NotAvailableError, SendError
+from e3dc._e3dc_rscp_local import BUFFER_SIZE, RSCPAuthenticationError
+from e3dc._RSCPEncryptDecrypt import BLOCK_SIZE
+from e3dc._rscpLib import rscpDecode, rscpEncode, rscpFrame, rscpFrameDecode
+
+from .metrics import REGISTRY
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+BATCH_FRAMES = REGISTRY.counter("e3dc_rscp_batch_frames_total", "Combined RSCP frames sent by batched polls")
+BATCH_REQUESTS = REGISTRY.counter("e3dc_rscp_batch_requests_total", "RSCP requests sent within combined frames")
+
+MAX_ROUNDS = 16
+
+# magic, ctrl, seconds (2x), nanoseconds, data length
+FRAME_HEADER = struct.Struct("<HHIIIH")
+FRAME_CRC_SIZE = 4
+FRAME_CRC_FLAG = 0x1000  # 0x10 of the byte swapped ctrl field
+
+
+class _Pending(BaseException):
+    """Aborts a call which needs a response that was not fetched yet. No Exception, so except clauses of the call do not catch it."""
+
+
+def send_batch(e3dc, requests: list, retries: int = 3) -> list:
+    """Sends all requests in one RSCP frame and returns the answers in request order.
+
+    An answer is the response tuple, or a NotAvailableError/SendError for a request the
+    device answered with an error. The connection is kept open for the next batch.
+    """
+    rscp = e3dc.rscp
+    retry = 0
+    while True:
+        try:
+            if not rscp.isConnected():
+                rscp.connect()
+            responses = _exchange(rscp, requests)
+            break
+        except RSCPAuthenticationError:
+            raise AuthenticationError()
+        except Exception as e:
+            rscp.disconnect()
+            retry += 1
+            if retry > retries:
+                raise SendError(f"Max retries reached: {e!r}")
+    BATCH_FRAMES.inc()
+    BATCH_REQUESTS.inc(len(requests))
+
+    answers = []
+    for response in responses:
+        if response[1] != "Error":
+            answers.append(response)
+        elif response[2] == "RSCP_ERR_ACCESS_DENIED":
+            rscp.disconnect()
+            raise AuthenticationError()
+        elif response[2] == "RSCP_ERR_NOT_AVAILABLE":
+            answers.append(NotAvailableError())
+        else:
+            answers.append(SendError(response[2]))
+    return answers
+
+
+def _exchange(rscp, requests: list) -> list:
+    rscp.socket.send(rscp.encdec.encrypt(rscpFrame(b"".join(rscpEncode(request) for request in requests))))
+    data = rscpFrameDecode(_receive_frame(rscp))[0]
+    responses = []
+    offset = 0
+    while offset < len(data):
+        response, size = rscpDecode(data[offset:])
+        responses.append(response)
+        offset += size
+    if len(responses) != len(requests):
+        raise ValueError(f"{len(responses)} answers to {len(requests)} requests")
+    return responses
+
+
+def _receive_frame(rscp) -> bytes:
+    """Receives one encrypted frame, which may arrive in several parts, and returns it decrypted"""
+    received = b""
+    size = None
+    while size is None or len(received) < size:
+        part = rscp.socket.recv(BUFFER_SIZE)
+        if not part:
+            raise ConnectionError("connection closed while receiving a frame")
+        received += part
+        if size is None and len(received) >= BLOCK_SIZE:
+            # decrypting changes the IV of the connection, so the header is decrypted by a copy
+            header = copy.copy(rscp.encdec).decrypt(received[:BLOCK_SIZE]).ljust(BLOCK_SIZE, b"\0")
+            _, ctrl, _, _, _, length = FRAME_HEADER.unpack_from(header)
+            size = FRAME_HEADER.size + length + (FRAME_CRC_SIZE if ctrl & FRAME_CRC_FLAG else 0)
+            size = -(-size // BLOCK_SIZE) * BLOCK_SIZE  # encrypted in whole blocks
+    return rscp.encdec.decrypt(received)
+
+
+class BatchedPoll:
+    """Runs several calls to pye3dc and combines the RSCP requests they send into as few frames as possible.
+
+    While the calls run, e3dc.sendRequest only answers from the responses fetched so far. A call
+    asking for anything else is aborted, its request goes into the next combined frame and the
+    call is repeated. The requests of every call are remembered and sent up front on the next
+    poll, so after the first poll a call needs one frame unless the device changed.
+    """
+
+    def __init__(self, max_rounds: int = MAX_ROUNDS) -> None:
+        self.max_rounds = max_rounds
+        self.__known = {}  # type: dict[str, list]
+
+    def run(self, e3dc, calls: dict) -> dict:
+        """Runs calls (key -> function without arguments), returns key -> result or the exception the call raised"""
+        answers = {}
+        results = {}
+        pending = dict(calls)
+        needed = {}
+        for key in pending:
+            needed.update((repr(request), request) for request in self.__known.get(key, []))
+
+        for _ in range(self.max_rounds):
+            needed = {key: request for key, request in needed.items() if key not in answers}
+            if len(needed) > 0:
+                answers.update(zip(needed.keys(), send_batch(e3dc, list(needed.values()))))
+            needed = {}
+
+            for key, call in list(pending.items()):
+                sent = []
+                e3dc.sendRequest = lambda request, retries=3, keepAlive=False: self.__answer(answers, needed, sent, request)
+                try:
+                    results[key] = call()
+                except _Pending:
+                    continue
+                except Exception as e:
+                    results[key] = e
+                finally:
+                    del e3dc.sendRequest
+                del pending[key]
+                if len(sent) > 0:
+                    self.__known[key] = sent
+            if len(pending) == 0:
+                return results
+
+        for key in pending:
+            results[key] = SendError(f"no complete answer after {self.max_rounds} frames")
+        return results
+
+    @staticmethod
+    def __answer(answers: dict, needed: dict, sent: list, request):
+        sent.append(request)
+        key = repr(request)
+        if key not in answers:
+            needed[key] = request
+            raise _Pending()
+        answer = answers[key]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .metrics import REGISTRY
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+CALL_DURATION = REGISTRY.histogram("e3dc_rscp_call_duration_seconds", "Time the E3/DC device needed to answer a call", ["worker", "method"])
+QUEUE_WAIT = REGISTRY.histogram("e3dc_rscp_queue_wait_seconds", "Time a call waited for the RSCP worker", ["worker", "method"])
+CALL_FAILURES = REGISTRY.counter("e3dc_rscp_call_failures_total", "Calls to the E3/DC device which raised an exception", ["worker", "method"])
+CALL_TIMEOUTS = REGISTRY.counter("e3dc_rscp_call_timeouts_total", "Calls to the E3/DC device which did not complete in time", ["worker", "method"])
+QUEUE_DEPTH = REGISTRY.gauge("e3dc_rscp_queue_depth", "Calls waiting for the RSCP worker", ["worker"])
+
+
+class RscpTimeoutError(Exception):
+    pass
+
+
+class RscpWorkerStoppedError(Exception):
+    pass
+
+
+class RscpWorker:
+    """Executes blocking RSCP calls one after another on a dedicated thread.
+
+    Calls are queued by priority (lower value runs first, FIFO within the same priority).
+    The awaiting coroutine gives up after the call timeout; a call which is still waiting
+    in the queue at that point is cancelled and never sent to the device.
+    """
+
+    __STOP = float("-inf")
+
+    def __init__(self, name: str = "rscp-worker", timeout: float = 10.0) -> None:
+        self.name = name
+        self.timeout = timeout
+        self.__queue = queue.PriorityQueue()
+        self.__sequence = itertools.count()
+        self.__thread = None  # type: threading.Thread
+        self.__stop_requested = False
+        QUEUE_DEPTH.labels(name).set_function(lambda: self.pending)
+
+    @property
+    def pending(self) -> int:
+        return self.__queue.qsize()
+
+    def start(self):
+        if self.__thread is not None:
+            return
+        self.__thread = threading.Thread(target=self.__run, name=self.name, daemon=True)
+        self.__thread.start()
+
+    async def call(self, func, *args, priority: int = 0, timeout: float = None, **kwargs):
+        if self.__stop_requested:
+            raise RscpWorkerStoppedError(f"{self.name} is stopped")
+        self.start()
+
+        future = Future()
+        future.queued = time.perf_counter()
+        self.__queue.put((priority, next(self.__sequence), future, func, args, kwargs))
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            # cancelling the wrapping asyncio future (timeout or caller cancelled) cancels the queued call as well
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            CALL_TIMEOUTS.labels(self.name, self.__method_name(func)).inc()
+            raise RscpTimeoutError(f"{self.__method_name(func)} did not complete within {timeout}s")
+
+    async def stop(self, timeout: float = None):
+        if self.__stop_requested:
+            return
+        self.__stop_requested = True
+        if self.__thread is None:
+            return
+
+        self.__queue.put((RscpWorker.__STOP, next(self.__sequence), None, None, None, None))
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.__thread.join, self.timeout if timeout is None else timeout)
+        if self.__thread.is_alive():
+            LOGGER.warning(f"{self.name} still busy with a device call, abandoning it")
+
+    @staticmethod
+    def __method_name(func) -> str:
+        return getattr(func, "__name__", str(func)).lstrip("_")
+
+    def __run(self):
+        while True:
+            priority, _, future, func, args, kwargs = self.__queue.get()
+            if priority == RscpWorker.__STOP:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled while waiting in the queue
+            method = self.__method_name(func)
+            start = time.perf_counter()
+            QUEUE_WAIT.labels(self.name, method).observe(start - future.queued)
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                CALL_FAILURES.labels(self.name, method).inc()
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                CALL_DURATION.labels(self.name, method).observe(time.perf_counter() - start)
+
+        # fail everything that was still queued behind the stop request
+        while not self.__queue.empty():
+            _, _, future, _, _, _ = self.__queue.get_nowait()
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(RscpWorkerStoppedError(f"{self.name} is stopped"))
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import math
+
+from .metrics import REGISTRY
+from .rscp_worker import RscpTimeoutError
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+POLL_DURATION = REGISTRY.histogram("e3dc_poll_duration_seconds", "Duration of a poll including publishing", ["device", "category"])
+POLL_FAILURES = REGISTRY.counter("e3dc_poll_failures_total", "Polls which failed", ["device", "category"])
+POLL_OVERRUNS = REGISTRY.counter("e3dc_poll_overruns_total", "Polls which took longer than their interval", ["device", "category"])
+POLL_SKIPPED_TICKS = REGISTRY.counter("e3dc_poll_skipped_ticks_total", "Polls skipped because the previous one overran", ["device", "category"])
+POLL_RATE = REGISTRY.gauge("e3dc_poll_rate_per_second", "Current polls per second, changes with adaptive polling", ["device", "category"])
+
+
+class PollCategory:
+    def __init__(self, name: str, interval: float, priority: int, callback) -> None:
+        self.name = name
+        self.interval = interval
+        self.priority = priority
+        self.callback = callback
+        self.runs = 0
+        self.skipped_ticks = 0
+
+
+class PollScheduler:
+    """Polls every category on its own interval.
+
+    Each deadline is the previous deadline plus the interval, so the schedule does not drift
+    with the duration of the poll itself. When a poll overruns one or more deadlines, those
+    ticks are skipped instead of being caught up. The interval of a category may be changed
+    while running, it applies from the next deadline on.
+    """
+
+    def __init__(self, device: str = "") -> None:
+        self.device = device
+        self.categories = {}  # type: dict[str, PollCategory]
+        self.__tasks = []
+
+    def add(self, name: str, interval: float, priority: int, callback) -> PollCategory:
+        category = PollCategory(name, interval, priority, callback)
+        self.categories[name] = category
+        POLL_RATE.labels(self.device, name).set_function(lambda: 1.0 / category.interval)
+        return category
+
+    async def run(self):
+        self.__tasks = [asyncio.ensure_future(self.__run_category(category)) for category in self.categories.values()]
+        try:
+            await asyncio.gather(*self.__tasks)
+        finally:
+            for task in self.__tasks:
+                task.cancel()
+
+    async def run_once(self, names: list = None):
+        """Polls the given categories (default: all) once, one after another, without any timing."""
+        for category in self.categories.values():
+            if names is None or category.name in names:
+                await category.callback(category)
+
+    async def __run_category(self, category: PollCategory):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time()
+        while True:
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                with POLL_DURATION.labels(self.device, category.name).time():
+                    await category.callback(category)
+                category.runs += 1
+            except RscpTimeoutError as e:
+                POLL_FAILURES.labels(self.device, category.name).inc()
+                LOGGER.error(f"E3/DC device did not respond in time, skipping {category.name}: {e}")
+            except Exception:
+                POLL_FAILURES.labels(self.device, category.name).inc()
+                LOGGER.exception(f"exception polling {category.name}")
+
+            deadline += category.interval
+            now = loop.time()
+            if now >= deadline:
+                skipped = math.floor((now - deadline) / category.interval) + 1
+                POLL_OVERRUNS.labels(self.device, category.name).inc()
+                POLL_SKIPPED_TICKS.labels(self.device, category.name).inc(skipped)
+                category.skipped_ticks += skipped
+                LOGGER.debug(f"polling {category.name} overran, skipped {skipped} tick(s)")
+                deadline += skipped * category.interval
@@ -0,0 +1,118 @@
+import json
+from datetime import date, timedelta
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, only needed for the msgpack codec
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # optional, only needed for the cbor codec
+    cbor2 = None
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+def json_default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, timedelta):
+        return o.total_seconds()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class StdlibJsonSerializer:
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+
+    def __init__(self) -> None:
+        # one encoder instance instead of a new one per json.dumps(..., cls=...) call
+        self.__encoder = json.JSONEncoder(default=json_default)
+
+    def dumps(self, payload) -> str:
+        return self.__encoder.encode(payload)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    name = "orjson"
+    content_type = JSON_CONTENT_TYPE
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+
+    def dumps(self, payload) -> bytes:
+        # dict keys of pvi phases/strings are ints, dates and datetimes are handled natively
+        return orjson.dumps(payload, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackSerializer:
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise ImportError("msgpack is not installed")
+
+    def dumps(self, payload) -> bytes:
+        return msgpack.packb(payload, default=json_default)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, strict_map_key=False)
+
+
+class CborSerializer:
+    name = "cbor"
+    content_type = "application/cbor"
+
+    def __init__(self) -> None:
+        if cbor2 is None:
+            raise ImportError("cbor2 is not installed")
+
+    def dumps(self, payload) -> bytes:
+        return cbor2.dumps(payload, default=self.__default)
+
+    def loads(self, data):
+        return cbor2.loads(data)
+
+    @staticmethod
+    def __default(encoder, value):
+        encoder.encode(json_default(value))
+
+
+# payload codecs which can be chosen per category, json uses the serializer given by --serializer
+CODECS = ["json", "msgpack", "cbor"]
+
+
+def get_serializer(name: str = "auto"):
+    if name == "auto":
+        return OrjsonSerializer() if orjson is not None else StdlibJsonSerializer()
+    if name == "orjson":
+        return OrjsonSerializer()
+    if name == "json":
+        return StdlibJsonSerializer()
+    if name == "msgpack":
+        return MsgpackSerializer()
+    if name == "cbor":
+        return CborSerializer()
+    raise ValueError(f"unknown serializer {name}")
+
+
+def get_serializer_for_content_type(content_type: str):
+    """Serializer decoding and encoding the MQTT v5 content type, None for unknown content types"""
+    for serializer in [MsgpackSerializer, CborSerializer]:
+        if serializer.content_type == content_type:
+            return serializer()
+    return None
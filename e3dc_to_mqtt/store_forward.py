@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from .dateTimeEncoder import DateTimeEncoder
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+
+
+class Sample:
+    def __init__(self, timestamp: float, topic: str, payload) -> None:
+        self.timestamp = timestamp
+        self.topic = topic
+        self.payload = payload
+
+
+class MemoryBuffer:
+    def __init__(self, max_samples: int, drop_policy: str = DROP_OLDEST) -> None:
+        self.max_samples = max_samples
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.__samples = deque()
+
+    def __len__(self) -> int:
+        return len(self.__samples)
+
+    def append(self, sample: Sample):
+        if len(self.__samples) >= self.max_samples:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return
+            self.__samples.popleft()
+        self.__samples.append(sample)
+
+    def peek(self) -> Sample:
+        return self.__samples[0]
+
+    def pop(self):
+        self.__samples.popleft()
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileBuffer:
+    """Append-only JSON lines file, survives restarts of the process.
+
+    The file is read from a head offset which moves forward as samples are replayed or dropped.
+    The lines before the head are removed by rewriting the file once they take as much space as
+    the buffered samples, after a replay and on close, so samples replayed since the last rewrite
+    are only sent again if the process was killed. An incomplete last line found on start is
+    removed, samples beyond max_samples are dropped according to the drop policy.
+    """
+
+    def __init__(self, path: str, max_samples: int, drop_policy: str = DROP_OLDEST) -> None:
+        self.path = path
+        self.max_samples = max_samples
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.__file = open(path, "a+b")
+        self.__head = 0
+        self.__head_sample = None
+        self.__count = 0
+        self.__file.seek(0)
+        end = 0
+        for line in self.__file:
+            if not line.endswith(b"\n"):
+                # partially written when the process was killed, the next sample would be appended to it
+                LOGGER.warning(f"removing incomplete last line of {path}")
+                self.__file.truncate(end)
+                break
+            self.__count += 1
+            end += len(line)
+        if self.__count > 0:
+            LOGGER.info(f"{self.__count} buffered samples found in {path}")
+        if self.__count > self.max_samples:
+            LOGGER.warning(f"{self.__count - self.max_samples} buffered samples in {path} dropped, buffer size is {self.max_samples}")
+            self.dropped += self.__count - self.max_samples
+            if self.drop_policy == DROP_NEWEST:
+                self.__truncate_after(self.max_samples)
+            else:
+                while self.__count > self.max_samples:
+                    self.pop()
+            self.compact()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def append(self, sample: Sample):
+        if self.__count >= self.max_samples:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return
+            self.pop()
+        line = json.dumps({"t": sample.timestamp, "topic": sample.topic, "payload": sample.payload}, cls=DateTimeEncoder)
+        self.__file.seek(0, os.SEEK_END)
+        self.__file.write(line.encode("utf-8") + b"\n")
+        self.__file.flush()
+        self.__count += 1
+
+    def peek(self) -> Sample:
+        while self.__head_sample is None:
+            self.__file.seek(self.__head)
+            try:
+                entry = json.loads(self.__file.readline())
+                self.__head_sample = Sample(entry["t"], entry["topic"], entry["payload"])
+            except (ValueError, KeyError):
+                LOGGER.warning(f"skipping corrupt line in {self.path}")  # e.g. partially written when the process was killed
+                self.pop()
+                if self.__count == 0:
+                    raise IndexError("buffer is empty")
+        return self.__head_sample
+
+    def pop(self):
+        self.__file.seek(self.__head)
+        self.__file.readline()
+        self.__head = self.__file.tell()
+        self.__head_sample = None
+        self.__count -= 1
+        if self.__count == 0:
+            self.__file.truncate(0)
+            self.__head = 0
+        elif self.__head >= self.__file.seek(0, os.SEEK_END) - self.__head:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the file without the lines before the head"""
+        if self.__head == 0:
+            return
+        self.__file.seek(self.__head)
+        remaining = self.__file.read()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(remaining)
+            f.flush()
+            os.fsync(f.fileno())
+        self.__file.close()
+        os.replace(tmp_path, self.path)
+        self.__file = open(self.path, "a+b")
+        self.__head = 0
+
+    def close(self):
+        self.compact()
+        self.__file.close()
+
+    def __truncate_after(self, count: int):
+        self.__file.seek(self.__head)
+        for _ in range(count):
+            self.__file.readline()
+        self.__file.truncate(self.__file.tell())
+        self.__count = count
+
+
+class StoreAndForward:
+    def __init__(self, buffer, replay_rate: float, publish_options=None) -> None:
+        self.buffer = buffer
+        self.replay_rate = replay_rate
+        # topic -> (qos, retain, codec) of the live topic, buffered samples are never retained
+        self.publish_options = publish_options
+        self.replayed = 0
+        self.__replay_task = None
+
+    def close(self):
+        if self.__replay_task is not None:
+            self.__replay_task.cancel()
+        self.buffer.close()
+
+    def store(self, topic: str, payload):
+        self.buffer.append(Sample(time.time(), topic, payload))
+
+    def replay_if_pending(self, mqtt):
+        if len(self.buffer) == 0 or (self.__replay_task is not None and not self.__replay_task.done()):
+            return
+        self.__replay_task = asyncio.ensure_future(self.__replay(mqtt))
+
+    async def __replay(self, mqtt):
+        LOGGER.info(f"replaying {len(self.buffer)} buffered samples")
+        try:
+            while len(self.buffer) > 0 and mqtt.is_connected:
+                sample = self.buffer.peek()
+                qos, _, codec = self.publish_options(sample.topic) if self.publish_options is not None else (0, False, None)
+                mqtt.publish(sample.topic, sample.payload, qos, False, sample.timestamp, codec)
+                self.buffer.pop()
+                self.replayed += 1
+                await asyncio.sleep(1 / self.replay_rate)
+        except Exception:
+            LOGGER.exception("exception replaying buffered samples")
+        try:
+            self.buffer.compact()
+        except OSError as e:
+            LOGGER.warning(f"buffer not compacted after replay: {e}")
+        if len(self.buffer) > 0:
+            LOGGER.warning(f"replay interrupted, {len(self.buffer)} samples left in buffer")
+        else:
+            LOGGER.info("replay of buffered samples completed")
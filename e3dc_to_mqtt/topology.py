@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+
+LOGGER = logging.getLogger("e3dc-to-mqtt")
+
+
+class Topology:
+    """Power meters, batteries and PV inverters of a device, in the configuration format of pye3dc:
+
+    {"powermeters": [{"index": 0}], "batteries": [{"index": 0}], "pvis": [{"index": 0, "strings": 2, "phases": 3}]}
+
+    None means not discovered yet.
+    """
+
+    def __init__(self, powermeters: list = None, batteries: list = None, pvis: list = None) -> None:
+        self.powermeters = powermeters
+        self.batteries = batteries
+        self.pvis = pvis
+
+    @property
+    def complete(self) -> bool:
+        return self.powermeters is not None and self.batteries is not None and self.pvis is not None
+
+    def to_dict(self) -> dict:
+        return {"powermeters": self.powermeters, "batteries": self.batteries, "pvis": self.pvis}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Topology) and self.to_dict() == other.to_dict()
+
+    def __str__(self) -> str:
+        return json.dumps(self.to_dict())
+
+    @staticmethod
+    def load(path: str):
+        if path is None or not os.path.exists(path):
+            return Topology()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return Topology(data.get("powermeters"), data.get("batteries"), data.get("pvis"))
+        except (OSError, ValueError, AttributeError) as e:
+            LOGGER.error(f"failed to read topology file {path}, discovering again: {e}")
+            return Topology()
+
+    def save(self, path: str):
+        if path is None:
+            return
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            LOGGER.error(f"failed to write topology file {path}: {e}")
@@ -0,0 +1,62 @@
+import json
+import logging
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+from .serializer import json_default
+
+
+class LazyJson:
+    """Pretty prints a payload only when the log record is actually formatted."""
+
+    def __init__(self, payload) -> None:
+        self.payload = payload
+
+    def __str__(self) -> str:
+        return json.dumps(self.payload, indent=2, default=json_default)
+
+
+class PayloadTracer:
+    """Writes a sample of the received payloads as JSON lines to a size rotated file.
+
+    Every payload is traced with probability sample_rate, at most max_per_second payloads are
+    written per second in total. Rates below 1 allow one payload every 1 / max_per_second seconds.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0, max_per_second: float = 1.0, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3) -> None:
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.dropped = 0
+        self.__tokens = max(1.0, max_per_second)
+        self.__last_refill = time.monotonic()
+
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.__logger = logging.getLogger("e3dc-to-mqtt.trace")
+        self.__logger.propagate = False
+        self.__logger.setLevel(logging.INFO)
+        self.__logger.addHandler(handler)
+        self.__handler = handler
+
+    def trace(self, category: str, payload):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if not self.__take_token():
+            self.dropped += 1
+            return
+        self.__logger.info(json.dumps({"time": time.time(), "category": category, "payload": payload}, default=json_default))
+
+    def close(self):
+        self.__logger.removeHandler(self.__handler)
+        self.__handler.close()
+
+    def __take_token(self) -> bool:
+        now = time.monotonic()
+        # room for at least one token, otherwise rates below 1 never write anything
+        self.__tokens = min(max(1.0, self.max_per_second), self.__tokens + (now - self.__last_refill) * self.max_per_second)
+        self.__last_refill = now
+        if self.__tokens < 1:
+            return False
+        self.__tokens -= 1
+        return True
@@ -4,6 +4,7 @@ VERSION = "0.0.1"
 NAME = "e3dc-to-mqtt"
 
 install_requires = ["pye3dc", "paho-mqtt", "Events"]
+extras_require = {"fast": ["orjson"], "msgpack": ["msgpack"], "cbor": ["cbor2"]}
 
 setup(
     name=NAME,
@@ -17,6 +18,7 @@ setup(
     url="https://github.com/mdhom/e3dc-to-mqtt",
     python_requires=">=3.7",
     install_requires=install_requires,
+    extras_require=extras_require,
     packages=["e3dc_to_mqtt"],
     entry_points={
         "console_scripts": [
@@ -0,0 +1,30 @@
+from e3dc_to_mqtt.aggregation import ENERGY_PREFIXES, MEASUREMENT_PREFIXES, WindowAggregator
+
+
+def _power_data(l1: float, mode: int) -> dict:
+    return {"activePhases": "111", "index": 6, "mode": mode, "power": {"L1": l1, "L2": 0.0, "L3": 0.0}, "type": 1}
+
+
+def test_min_max_mean_and_energy():
+    aggregator = WindowAggregator(60.0, ENERGY_PREFIXES["live"])
+    aggregator.add(0.0, {"production": {"solar": 1000}, "autarky": 80.0})
+    aggregator.add(30.0, {"production": {"solar": 3000}, "autarky": 90.0})
+    summary = aggregator.add(60.0, {"production": {"solar": 0}, "autarky": 100.0})
+
+    assert summary["samples"] == 2
+    assert summary["values"]["production"]["solar"] == {"min": 1000, "max": 3000, "mean": 2000.0, "energy": 33.333}
+    assert summary["values"]["autarky"] == {"min": 80.0, "max": 90.0, "mean": 85.0}
+
+
+def test_identifiers_and_states_passed_through():
+    aggregator = WindowAggregator(60.0, ENERGY_PREFIXES["power_data"], measurement_prefixes=MEASUREMENT_PREFIXES["power_data"])
+    aggregator.add(0.0, _power_data(100.0, 1))
+    aggregator.add(30.0, _power_data(300.0, 2))
+    summary = aggregator.add(60.0, _power_data(0.0, 2))
+
+    values = summary["values"]
+    assert values["index"] == 6
+    assert values["type"] == 1
+    assert values["mode"] == 2
+    assert values["power"]["L1"]["mean"] == 200.0
+    assert "activePhases" not in values
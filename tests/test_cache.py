@@ -0,0 +1,71 @@
+import asyncio
+
+from e3dc_to_mqtt import cache
+from e3dc_to_mqtt.cache import DbDataCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class Fetcher:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return {"call": self.calls}
+
+
+def test_closed_period_kept_until_evicted(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    db_cache = DbDataCache(max_entries=2, current_ttl=10.0)
+    fetch = Fetcher()
+
+    async def run():
+        await db_cache.get("a", True, fetch)
+        clock.now += 3600
+        return await db_cache.get("a", True, fetch)
+
+    assert asyncio.run(run()) == {"call": 1}
+    assert fetch.calls == 1
+
+
+def test_open_period_expires_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    db_cache = DbDataCache(current_ttl=10.0)
+    fetch = Fetcher()
+
+    async def run():
+        first = await db_cache.get("a", False, fetch)
+        clock.now += 5
+        cached = await db_cache.get("a", False, fetch)
+        clock.now += 10
+        expired = await db_cache.get("a", False, fetch)
+        return first, cached, expired
+
+    assert asyncio.run(run()) == ({"call": 1}, {"call": 1}, {"call": 2})
+
+
+def test_open_period_not_served_after_it_closed(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    db_cache = DbDataCache(current_ttl=300.0)
+    fetch = Fetcher()
+
+    async def run():
+        # cached shortly before midnight, requested again right after the day closed
+        await db_cache.get("a", False, fetch)
+        clock.now += 1
+        final = await db_cache.get("a", True, fetch)
+        clock.now += 3600
+        return final, await db_cache.get("a", True, fetch)
+
+    assert asyncio.run(run()) == ({"call": 2}, {"call": 2})
+    assert fetch.calls == 2
@@ -0,0 +1,43 @@
+import asyncio
+
+from e3dc_to_mqtt.capture import CaptureWriter, ReplayE3DC
+from e3dc_to_mqtt.e3dc_to_mqtt_base import E3DCClient
+from e3dc_to_mqtt.topology import Topology
+
+TOPOLOGY = Topology([{"index": 0}], [{"index": 0}, {"index": 1}], [{"index": 0, "strings": 2, "phases": 3, "temperatures": 0}])
+
+
+def test_topology_written_to_capture(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    writer = CaptureWriter(path)
+    writer.record_topology(TOPOLOGY)
+    writer.record(0.0, 0.01, "poll", (), {}, {"autarky": 90})
+    writer.close()
+
+    assert ReplayE3DC.recorded_topology(path) == TOPOLOGY
+    assert ReplayE3DC(path, speed=0).poll() == {"autarky": 90}
+
+
+def test_capture_without_topology(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    CaptureWriter(path).close()
+
+    assert ReplayE3DC.recorded_topology(path) is None
+
+
+def test_recorded_topology_neither_probed_nor_saved(tmp_path):
+    topology_file = tmp_path / "topology.json"
+
+    def factory(connectType, **kwargs):
+        raise AssertionError("device must not be probed")
+
+    client = E3DCClient("capture.jsonl", None, None, None, e3dc_factory=factory, topology_file=str(topology_file), topology=TOPOLOGY)
+
+    async def run():
+        try:
+            return await client.discover_topology()
+        finally:
+            await client.stop()
+
+    assert asyncio.run(run()) == TOPOLOGY
+    assert not topology_file.exists()
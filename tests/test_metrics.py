@@ -0,0 +1,21 @@
+from e3dc_to_mqtt.metrics import MetricsRegistry
+
+
+def test_render_counter_and_histogram():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests", ["result"]).labels("hit").inc(2)
+    registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)).observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{result="hit"} 2' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 0' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 1' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in lines
+    assert "latency_seconds_count 1" in lines
+
+
+def test_label_values_escaped():
+    registry = MetricsRegistry()
+    registry.gauge("device_up", "Device reachable", ["device"]).labels('garage "east"\\2\nnew').set(1)
+
+    assert 'device_up{device="garage \\"east\\"\\\\2\\nnew"} 1' in registry.render().splitlines()
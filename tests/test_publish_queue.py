@@ -0,0 +1,43 @@
+import logging
+
+from e3dc_to_mqtt import publish_queue
+from e3dc_to_mqtt.publish_queue import DROPPED, OutboundMessage, PublishQueue
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_newest_message_per_topic_kept():
+    queue = PublishQueue(10, 1000)
+    queue.put(OutboundMessage("a", "1"))
+    queue.put(OutboundMessage("b", "2"))
+    queue.put(OutboundMessage("a", "3"))
+    queue.put(OutboundMessage("a", "4", 0), coalesce=False)
+
+    assert [(m.topic, m.data) for m in (queue.pop(), queue.pop(), queue.pop())] == [("a", "3"), ("b", "2"), ("a", "4")]
+    assert queue.bytes == 0
+
+
+def test_drops_counted_and_warned_once_per_interval(monkeypatch, caplog):
+    clock = FakeClock()
+    monkeypatch.setattr(publish_queue, "time", clock)
+    queue = PublishQueue(2, 1000)
+    dropped = DROPPED.labels().value
+
+    with caplog.at_level(logging.WARNING, logger="e3dc-to-mqtt"):
+        for i in range(5):
+            queue.put(OutboundMessage(f"topic/{i}", "x"))
+        clock.now += publish_queue.DROP_WARNING_INTERVAL
+        queue.put(OutboundMessage("topic/5", "x"))
+
+    assert DROPPED.labels().value - dropped == 4
+    assert [queue.pop().topic, queue.pop().topic] == ["topic/4", "topic/5"]
+    warnings = [record.getMessage() for record in caplog.records]
+    assert len(warnings) == 2
+    assert "dropped 1 messages" in warnings[0]
+    assert "dropped 3 messages" in warnings[1]
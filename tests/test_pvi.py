@@ -0,0 +1,59 @@
+from e3dc_to_mqtt.pvi import build_pvi_request, parse_pvi_response
+
+
+def _indexed(tag: str, index: int, value: float) -> tuple:
+    return (tag, "Container", [("PVI_INDEX", "Uint16", index), ("PVI_VALUE", "Float32", value)])
+
+
+def test_request_contains_every_string_and_phase():
+    request = build_pvi_request(1, range(2), range(3), range(1))
+    tags = [tag for tag, _, _ in request[2]]
+
+    assert request[0] == "PVI_REQ_DATA"
+    assert request[2][0] == ("PVI_INDEX", "Uint16", 1)
+    assert tags.count("PVI_REQ_DC_POWER") == 2
+    assert tags.count("PVI_REQ_AC_POWER") == 3
+    assert tags.count("PVI_REQ_TEMPERATURE") == 1
+
+
+def test_indexed_values_grouped():
+    response = (
+        "PVI_DATA",
+        "Container",
+        [
+            ("PVI_INDEX", "Uint16", 0),
+            ("PVI_ON_GRID", "Bool", True),
+            _indexed("PVI_DC_POWER", 1, 200.123),
+            _indexed("PVI_DC_POWER", 0, 100.0),
+            _indexed("PVI_DC_VOLTAGE", 0, 400.0),
+            _indexed("PVI_AC_POWER", 0, 300.0),
+            _indexed("PVI_TEMPERATURE", 0, 35.5),
+        ],
+    )
+    data = parse_pvi_response(0, response)
+
+    assert data["onGrid"] is True
+    assert data["strings"] == {0: {"power": 100.0, "voltage": 400.0}, 1: {"power": 200.12}}
+    assert list(data["strings"]) == [0, 1]
+    assert data["phases"] == {0: {"power": 300.0}}
+    assert data["temperature"]["values"] == [35.5]
+
+
+def test_error_answer_skipped():
+    response = (
+        "PVI_DATA",
+        "Container",
+        [
+            ("PVI_INDEX", "Uint16", 0),
+            _indexed("PVI_DC_POWER", 0, 100.0),
+            ("PVI_DC_POWER", "Error", 6),
+            ("PVI_AC_POWER", "Error", 6),
+            _indexed("PVI_AC_POWER", 1, 300.0),
+            ("PVI_TEMPERATURE", "Error", 6),
+        ],
+    )
+    data = parse_pvi_response(0, response)
+
+    assert data["strings"] == {0: {"power": 100.0}}
+    assert data["phases"] == {1: {"power": 300.0}}
+    assert data["temperature"]["values"] == []
@@ -0,0 +1,82 @@
+import pytest
+from e3dc._e3dc import NotAvailableError, SendError
+
+from benchmarks.fake_e3dc import FakeE3DC, FakeRscpConnection
+from e3dc_to_mqtt.pvi import build_pvi_request
+from e3dc_to_mqtt.rscp_batch import BatchedPoll, send_batch
+
+PVI_REQUEST = build_pvi_request(0, range(2), range(3), range(2))
+
+
+class DroppingConnection(FakeRscpConnection):
+    """Closes the connection after the first part of the next drops answers"""
+
+    def __init__(self, device, drops: int) -> None:
+        super().__init__(device)
+        self.drops = drops
+        self.parts = 0
+
+    def send(self, data):
+        self.parts = 0
+        super().send(data)
+
+    def recv(self, size):
+        self.parts += 1
+        if self.parts > 1 and self.drops > 0:
+            self.drops -= 1
+            return b""
+        return super().recv(size)
+
+
+def _calls(e3dc: FakeE3DC, batteries) -> dict:
+    calls = {"live": e3dc.poll, "power_data": lambda: e3dc.get_powermeter_data(pmIndex=0)}
+    for index in batteries:
+        calls[f"battery_data/{index}"] = lambda index=index: e3dc.get_battery_data(batIndex=index)
+    return calls
+
+
+def test_full_batch():
+    e3dc = FakeE3DC(batteries=2, seed=1)
+    poll = BatchedPoll()
+    poll.run(e3dc, _calls(e3dc, [0, 1]))
+
+    round_trips = e3dc.round_trips
+    results = poll.run(e3dc, _calls(e3dc, [0, 1]))
+
+    # the requests of the first poll are known, all of them go into one frame
+    assert e3dc.round_trips - round_trips == 1
+    assert results["live"]["selfConsumption"] == 100.0
+    assert results["power_data"]["voltage"]["L1"] == pytest.approx(231.2)
+    assert [results[f"battery_data/{index}"]["index"] for index in [0, 1]] == [0, 1]
+    assert results["battery_data/0"]["dcbs"][0]["cycleCount"] == 412
+
+
+def test_error_answer_fails_its_call_only():
+    e3dc = FakeE3DC(batteries=1, seed=1)
+    results = BatchedPoll().run(e3dc, _calls(e3dc, [0, 3]))
+
+    assert isinstance(results["battery_data/3"], NotAvailableError)
+    assert results["battery_data/0"]["index"] == 0
+    assert "autarky" in results["live"]
+
+    answers = send_batch(e3dc, [PVI_REQUEST, build_pvi_request(7, [], [], [])])
+    assert answers[0][0] == "PVI_DATA"
+    assert isinstance(answers[1], NotAvailableError)
+
+
+def test_connection_drop_mid_batch_retried():
+    e3dc = FakeE3DC(seed=1)
+    e3dc.rscp = DroppingConnection(e3dc, drops=2)
+    answers = send_batch(e3dc, [PVI_REQUEST] * 3)
+
+    assert e3dc.rscp.drops == 0
+    assert [answer[0] for answer in answers] == ["PVI_DATA"] * 3
+    assert e3dc.rscp.isConnected()
+
+
+def test_connection_drops_beyond_retries():
+    e3dc = FakeE3DC(seed=1)
+    e3dc.rscp = DroppingConnection(e3dc, drops=4)
+
+    with pytest.raises(SendError):
+        send_batch(e3dc, [PVI_REQUEST] * 3, retries=3)
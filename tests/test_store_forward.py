@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from e3dc_to_mqtt.store_forward import DROP_NEWEST, FileBuffer, MemoryBuffer, Sample, StoreAndForward
+
+
+class FakeMqtt:
+    def __init__(self) -> None:
+        self.is_connected = True
+        self.published = []
+
+    def publish(self, topic, payload, qos, retain, timestamp, codec):
+        self.published.append((topic, payload, timestamp))
+
+
+def _fill(buffer, count: int, start: int = 0):
+    for i in range(start, start + count):
+        buffer.append(Sample(float(i), f"live/{i}", {"value": i}))
+
+
+def _drain(buffer) -> list:
+    topics = []
+    while len(buffer) > 0:
+        topics.append(buffer.peek().topic)
+        buffer.pop()
+    return topics
+
+
+def test_compaction_removes_replayed_lines(tmp_path):
+    path = tmp_path / "buffer.jsonl"
+    buffer = FileBuffer(str(path), 100)
+    _fill(buffer, 10)
+    size = path.stat().st_size
+    for _ in range(6):
+        buffer.pop()
+
+    # compacted once the replayed lines took as much space as the remaining ones
+    assert path.stat().st_size < size
+    buffer.close()
+    assert [json.loads(line)["topic"] for line in path.read_text().splitlines()] == [f"live/{i}" for i in range(6, 10)]
+    assert not (tmp_path / "buffer.jsonl.tmp").exists()
+
+
+def test_restart_after_truncated_last_line(tmp_path):
+    path = tmp_path / "buffer.jsonl"
+    buffer = FileBuffer(str(path), 100)
+    _fill(buffer, 3)
+    buffer.close()
+    with open(path, "ab") as f:
+        f.write(b'{"t": 3.0, "topic": "live/3", "pay')
+
+    buffer = FileBuffer(str(path), 100)
+    assert len(buffer) == 3
+    _fill(buffer, 1, start=4)
+    buffer.close()
+
+    assert _drain(FileBuffer(str(path), 100)) == ["live/0", "live/1", "live/2", "live/4"]
+
+
+def test_restart_keeps_order_and_limit(tmp_path):
+    path = tmp_path / "buffer.jsonl"
+    buffer = FileBuffer(str(path), 100)
+    _fill(buffer, 5)
+    buffer.close()
+
+    assert _drain(FileBuffer(str(path), 3)) == ["live/2", "live/3", "live/4"]
+
+    buffer = FileBuffer(str(path), 100)
+    _fill(buffer, 5)
+    buffer.close()
+    assert _drain(FileBuffer(str(path), 3, DROP_NEWEST)) == ["live/0", "live/1", "live/2"]
+
+
+def test_replay_in_order(tmp_path):
+    mqtt = FakeMqtt()
+
+    async def run(buffer):
+        store_forward = StoreAndForward(buffer, 10000.0)
+        _fill(buffer, 3)
+        store_forward.replay_if_pending(mqtt)
+        while len(buffer) > 0:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.01)
+        store_forward.close()
+        return store_forward.replayed
+
+    for buffer in [MemoryBuffer(10), FileBuffer(str(tmp_path / "buffer.jsonl"), 10)]:
+        mqtt.published.clear()
+        assert asyncio.run(run(buffer)) == 3
+        assert mqtt.published == [(f"live/{i}", {"value": i}, float(i)) for i in range(3)]
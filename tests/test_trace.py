@@ -0,0 +1,45 @@
+from e3dc_to_mqtt import trace
+from e3dc_to_mqtt.trace import PayloadTracer
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_rate_below_one_writes_one_payload_per_interval(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(trace, "time", clock)
+    path = tmp_path / "trace.jsonl"
+    tracer = PayloadTracer(str(path), max_per_second=0.2)
+    try:
+        for _ in range(20):
+            tracer.trace("live", {"value": 1})
+            clock.now += 1
+    finally:
+        tracer.close()
+
+    # 20 s at one payload every 5 s
+    assert len(path.read_text().splitlines()) == 4
+    assert tracer.dropped == 16
+
+
+def test_burst_limited_to_rate(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(trace, "time", clock)
+    path = tmp_path / "trace.jsonl"
+    tracer = PayloadTracer(str(path), max_per_second=3)
+    try:
+        for _ in range(10):
+            tracer.trace("live", {"value": 1})
+    finally:
+        tracer.close()
+
+    assert len(path.read_text().splitlines()) == 3
+    assert tracer.dropped == 7